@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import queue
+import threading
+
+import pendulum
+import pytest
+
+from youtube_automanager.config import YoutubeAutoManagerConfig
+from youtube_automanager.db import DatabaseController
+from youtube_automanager.inserts import InsertExecutor, InsertTask
+from youtube_automanager.runners import automanage
+from youtube_automanager.runners.automanage import YoutubeAutoManager
+from youtube_automanager.websub import FeedEntry
+
+CONFIG = """
+start_date: 2022-06-17 00:00
+rules:
+  - channel_id: "UC1"
+    playlist_id: "PL1"
+"""
+
+
+class API:
+    def __init__(self):
+        self.calls = 0
+
+    def get_playlists(self):
+        self.calls += 1
+        raise ConnectionError
+
+
+@pytest.fixture
+def manager(tmp_path):
+    config_filepath = tmp_path / "config.yml"
+    config_filepath.write_text(CONFIG, encoding="utf-8")
+    return YoutubeAutoManager(
+        oauth=None,
+        db=DatabaseController(db_filepath=tmp_path / "yam.db", username="user"),
+        config=YoutubeAutoManagerConfig(config_filepath),
+    )
+
+
+def test_failing_notification_does_not_stop_the_server(manager):
+    manager._yt_api = api = API()  # noqa: SLF001
+    notifications = queue.Queue()
+    for video_id in ("VIDEO1", "VIDEO2"):
+        notifications.put(FeedEntry(video_id, "UC1", "Channel", "Title", "2030-01-01T00:00:00+00:00"))
+    manager.process_notifications(notifications, timeout=0.5)
+    assert api.calls == 2  # noqa: PLR2004
+    assert notifications.empty()
+    manager.inserts.shutdown()
+
+
+def test_stop_during_the_final_wait_records_finished_inserts(manager, monkeypatch):
+    release = threading.Event()
+
+    def insert(task):
+        if task.video_id == "VIDEO2":
+            release.wait()
+
+    manager.inserts = inserts = InsertExecutor(insert, max_workers=1)
+    join = inserts.join
+    joins = []
+
+    def interrupted_join(timeout=None):
+        # SIGTERM arrives while the run waits for the queue, shutdown joins again after it
+        joins.append(timeout)
+        if len(joins) > 1:
+            return join(timeout)
+
+        join(timeout=0.1)
+        raise SystemExit(143)
+
+    monkeypatch.setattr(inserts, "join", interrupted_join)
+    monkeypatch.setattr(automanage, "STOP_TIMEOUT", 0.1)
+    inserts.submit_many(
+        InsertTask(
+            video_id=video_id,
+            video_title=video_id,
+            playlist_id="PL1",
+            playlist_title="Playlist",
+            channel_id="UC1",
+            channel_name="Channel",
+            published_at=pendulum.datetime(2030, 1, day),
+        )
+        for day, video_id in enumerate(("VIDEO1", "VIDEO2", "VIDEO3"), start=1)
+    )
+    try:
+        with pytest.raises(SystemExit):
+            manager.wait_inserts()
+        assert manager.db.in_ledger("PL1", "VIDEO1")
+        assert not manager.db.in_ledger("PL1", "VIDEO3")
+    finally:
+        release.set()
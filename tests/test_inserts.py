@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter, defaultdict
+
+import pendulum
+
+from youtube_automanager.inserts import InsertCancelledError, InsertExecutor, InsertTask
+
+
+def task(video_id, playlist_id="PL1", day=1):
+    return InsertTask(
+        video_id=video_id,
+        video_title=video_id,
+        playlist_id=playlist_id,
+        playlist_title=playlist_id,
+        channel_id="UC1",
+        channel_name="channel",
+        published_at=pendulum.datetime(2025, 1, day),
+    )
+
+
+def test_cancel_drops_queued_tasks():
+    started = threading.Event()
+    release = threading.Event()
+
+    def insert(_task):
+        started.set()
+        release.wait()
+
+    executor = InsertExecutor(insert, max_workers=1)
+    for i, video_id in enumerate(("v1", "v2", "v3"), start=1):
+        executor.submit(task(video_id, day=i))
+    started.wait()
+    executor.cancel()
+    assert executor.pending("UC1") == 1
+    release.set()
+    assert executor.join(timeout=5)
+    completed = {t.video_id: error for t, error in executor.completed()}
+    assert completed["v1"] is None
+    assert isinstance(completed["v2"], InsertCancelledError)
+    assert isinstance(completed["v3"], InsertCancelledError)
+    assert executor.submit(task("v2"))
+    executor.shutdown(timeout=5)
+
+
+def test_batches_are_written_in_publish_order_one_writer_each():
+    lock = threading.Lock()
+    written = defaultdict(list)
+    active = Counter()
+    overlaps = []
+
+    def insert(task_):
+        with lock:
+            active[task_.playlist_id] += 1
+            overlaps.append(active[task_.playlist_id] > 1)
+        time.sleep(0.001)
+        with lock:
+            written[task_.playlist_id].append(task_.video_id)
+            active[task_.playlist_id] -= 1
+
+    executor = InsertExecutor(insert, max_workers=4)
+    playlists = ("PL1", "PL2")
+    tasks = []
+    # found newest first, with matching work between the videos like a channel parse does
+    for day in (9, 7, 5, 3, 2):
+        time.sleep(0.01)
+        tasks.extend(task(f"v{day}", playlist_id=playlist_id, day=day) for playlist_id in playlists)
+    assert executor.submit_many([*tasks, task("v5", playlist_id="PL1", day=5)]) == len(tasks)
+    assert executor.join(timeout=5)
+    executor.shutdown()
+
+    for playlist_id in playlists:
+        assert written[playlist_id] == ["v2", "v3", "v5", "v7", "v9"]
+    assert not any(overlaps)
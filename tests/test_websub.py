@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hmac
+
+import pytest
+
+from youtube_automanager.db import DatabaseController, WebSubSubscription
+from youtube_automanager.websub import parse_feed, signature_ok, topic_url, WebSubServer, WebSubSubscriber
+
+USERNAME = "user"
+
+
+class Response:
+    ok = True
+
+
+class Session:
+    def __init__(self):
+        self.requests = []
+
+    def post(self, url, data, timeout):  # noqa: ARG002
+        self.requests.append((data["hub.mode"], data["hub.topic"]))
+        return Response()
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseController(db_filepath=tmp_path / "yam.db", username=USERNAME)
+
+
+@pytest.fixture
+def server(db):
+    return WebSubServer(db.db_filepath, USERNAME, "https://example.com/websub", host="127.0.0.1", port=0)
+
+
+def subscriber(db):
+    return WebSubSubscriber(db, "https://hub", "https://example.com/websub", lease_seconds=3600, session=Session())
+
+
+def verification(mode, channel_id="UC1"):
+    return {"hub.mode": mode, "hub.topic": topic_url(channel_id), "hub.challenge": "challenge"}
+
+
+def state(db, channel_id="UC1"):
+    with db.unit_of_work():
+        return db.websub_subscription(channel_id).state
+
+
+def test_subscribe_is_confirmed_for_requested_subscriptions(db, server):
+    subscriber(db).sync(["UC1"])
+    assert state(db) == WebSubSubscription.PENDING
+    assert server.verify(verification("subscribe")) == "challenge"
+    assert state(db) == WebSubSubscription.SUBSCRIBED
+
+
+def test_unknown_topics_are_refused(db, server):
+    subscriber(db).sync(["UC1"])
+    assert server.verify(verification("subscribe", channel_id="UC2")) is None
+
+
+def test_unrequested_unsubscribe_is_refused(db, server):
+    subscriber(db).sync(["UC1"])
+    server.verify(verification("subscribe"))
+    assert server.verify(verification("unsubscribe")) is None
+    assert state(db) == WebSubSubscription.SUBSCRIBED
+
+
+def test_requested_unsubscribe_is_confirmed(db, server):
+    websub = subscriber(db)
+    websub.sync(["UC1"])
+    server.verify(verification("subscribe"))
+    websub.sync([])
+    assert websub.session.requests[-1] == ("unsubscribe", topic_url("UC1"))
+    assert state(db) == WebSubSubscription.UNSUBSCRIBING
+    assert server.verify(verification("subscribe")) is None
+    assert server.verify(verification("unsubscribe")) == "challenge"
+    assert state(db) == WebSubSubscription.UNSUBSCRIBED
+
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+  <entry>
+    <id>yt:video:VIDEO1</id>
+    <yt:videoId>VIDEO1</yt:videoId>
+    <yt:channelId>UC1</yt:channelId>
+    <title>Video title</title>
+    <author><name>Channel name</name></author>
+    <published>2025-01-02T03:04:05+00:00</published>
+  </entry>
+  <entry>
+    <title>entry without a video</title>
+  </entry>
+  <entry>
+    <yt:videoId>VIDEO2</yt:videoId>
+    <yt:channelId>UC1</yt:channelId>
+    <title>entry without a publish date</title>
+  </entry>
+</feed>
+"""
+SECRET = "secret"  # noqa: S105
+
+
+def signature(body, secret=SECRET, method="sha1"):
+    return f"{method}={hmac.new(secret.encode(), body, method).hexdigest()}"
+
+
+def test_parse_feed():
+    (entry,) = parse_feed(FEED)
+    assert entry.video_id == "VIDEO1"
+    assert entry.channel_id == "UC1"
+    assert entry.channel_name == "Channel name"
+    assert entry.title == "Video title"
+    assert entry.published_at == "2025-01-02T03:04:05+00:00"
+
+
+def test_signature_ok():
+    assert signature_ok(SECRET, FEED, signature(FEED))
+    assert signature_ok(SECRET, FEED, signature(FEED, method="sha256"))
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        None,
+        "",
+        "sha1",
+        signature(FEED, secret="other"),  # noqa: S106
+        signature(FEED + b" "),
+        signature(FEED, method="md5"),
+        signature(FEED).replace("sha1=", "sha256="),
+    ],
+)
+def test_signature_ok_rejects(header):
+    assert not signature_ok(SECRET, FEED, header)
+
+
+def test_notify_drops_bad_signatures(db, server):
+    subscriber(db).sync(["UC1"])
+    with db.unit_of_work():
+        secret = db.websub_subscription("UC1").secret
+    assert server.notify(FEED, signature(FEED)) == 0
+    assert server.notify(FEED, signature(FEED, secret=secret)) == 1
+    assert server.queue.get_nowait().video_id == "VIDEO1"
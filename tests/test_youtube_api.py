@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from youtube_automanager.youtube_api import single_flight, SingleFlight, transient_error, YoutubeAPI
+
+WAITERS = 8
+
+
+def http_error(status, reason):
+    body = {"error": {"code": status, "message": reason, "errors": [{"reason": reason}]}}
+    return HttpError(httplib2.Response({"status": status}), json.dumps(body).encode())
+
+
+def test_clear_forgets_results():
+    flight = SingleFlight()
+    calls = []
+
+    def call():
+        calls.append(len(calls))
+        return calls[-1]
+
+    results = [flight.do("key", call), flight.do("key", call)]
+    flight.clear()
+    results.append(flight.do("key", call))
+    assert results == [0, 0, 1]
+
+
+@pytest.mark.parametrize(
+    ("error", "transient"),
+    [
+        (http_error(403, "quotaExceeded"), True),
+        (http_error(403, "rateLimitExceeded"), True),
+        (http_error(500, "backendError"), True),
+        (http_error(503, "serviceUnavailable"), True),
+        (ConnectionError("reset"), True),
+        (http_error(404, "videoNotFound"), False),
+        (http_error(403, "forbidden"), False),
+        (http_error(403, "playlistContainsMaximumNumberOfVideos"), False),
+    ],
+)
+def test_transient_error(error, transient):
+    assert transient_error(error) is transient
+
+
+class BoomError(Exception):
+    pass
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait()
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=WAITERS) as pool:
+        futures = [pool.submit(flight.do, "key", call) for _ in range(WAITERS)]
+        while flight.stats["calls"] < WAITERS:
+            time.sleep(0.01)
+        release.set()
+        results = [_.result() for _ in futures]
+
+    assert results == ["result"] * WAITERS
+    assert calls == [1]
+    assert flight.stats["coalesced"] == WAITERS - 1
+
+
+def test_concurrent_calls_share_the_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def call():
+        release.wait()
+        raise BoomError
+
+    with ThreadPoolExecutor(max_workers=WAITERS) as pool:
+        futures = [pool.submit(flight.do, "key", call) for _ in range(WAITERS)]
+        while flight.stats["calls"] < WAITERS:
+            time.sleep(0.01)
+        release.set()
+        errors = [_.exception() for _ in futures]
+
+    assert all(isinstance(_, BoomError) for _ in errors)
+    assert flight.stats["executed"] == 1
+
+
+def test_failed_calls_are_not_cached():
+    flight = SingleFlight()
+
+    def fail():
+        raise BoomError
+
+    with pytest.raises(BoomError):
+        flight.do("key", fail)
+    assert flight.do("key", lambda: "result") == "result"
+
+
+class API(YoutubeAPI):
+    def __init__(self):
+        super().__init__(api=None, access_token="token")  # noqa: S106
+        self.calls = []
+
+    @single_flight
+    def get_items(self, playlist_id, limit=50, parts=("snippet",), **kwargs):
+        self.calls.append((playlist_id, limit, parts, kwargs))
+        return len(self.calls)
+
+
+def test_positional_keyword_and_default_arguments_are_one_call():
+    api = API()
+    first = api.get_items("PL1")
+    assert api.get_items("PL1", 50) == first
+    assert api.get_items(playlist_id="PL1", limit=50) == first
+    assert api.get_items("PL1", parts=["snippet"]) == first
+    assert len(api.calls) == 1
+
+
+def test_different_arguments_are_different_calls():
+    api = API()
+    api.get_items("PL1")
+    api.get_items("PL2")
+    api.get_items("PL1", limit=5)
+    api.get_items("PL1", page_token="next")  # noqa: S106
+    assert api.calls == [
+        ("PL1", 50, ("snippet",), {}),
+        ("PL2", 50, ("snippet",), {}),
+        ("PL1", 5, ("snippet",), {}),
+        ("PL1", 50, ("snippet",), {"page_token": "next"}),
+    ]
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import math
+
+import pendulum
+from global_logger import Log
+
+from youtube_automanager.db import BackfillItem, BackfillJob, local_now, PlaylistLedger
+from youtube_automanager.inserts import InsertTask
+from youtube_automanager.notifications import INFO
+from youtube_automanager.youtube_api import PAGE_SIZE
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from youtube_automanager.config import Backfill
+    from youtube_automanager.db import DatabaseController
+    from youtube_automanager.runners.automanage import YoutubeAutoManager
+
+LOG = Log.get_logger()
+LOCAL = pendulum.local_timezone()
+# the API quota resets at midnight Pacific time
+QUOTA_TIMEZONE = "America/Los_Angeles"
+# quota units of the calls a backfill makes
+LIST_COST = 1
+INSERT_COST = 50
+
+
+def quota_day() -> str:
+    return pendulum.now(QUOTA_TIMEZONE).to_date_string()
+
+
+def describe(db: DatabaseController, job: BackfillJob, progress: dict[str, int] | None = None):
+    progress = progress if progress is not None else db.backfill_progress(job.job_id)
+    added = progress.get(BackfillItem.ADDED, 0)
+    skipped = progress.get(BackfillItem.SKIPPED, 0)
+    total = sum(progress.values())
+    return f"{job.state}, {job.scanned} uploads scanned, {added + skipped}/{total} videos done ({skipped} skipped)"
+
+
+class QuotaBudget:
+    """
+    Quota units backfills may spend: ``share`` of the daily quota, minus what they already spent this quota day.
+
+    The regular run is never limited, it always runs before the backfills.
+    """
+
+    def __init__(self, db: DatabaseController, daily_quota: int, share: float):
+        self.db = db
+        self.day = quota_day()
+        self.limit = int(daily_quota * share)
+        config = db.config
+        self.used_before = (config.backfill_quota_used or 0) if config.backfill_quota_day == self.day else 0
+        self.spent = 0
+
+    @property
+    def remaining(self):
+        return max(0, self.limit - self.used_before - self.spent)
+
+    def spend(self, units) -> bool:
+        """Reserve ``units`` if the budget allows it."""
+        if units > self.remaining:
+            return False
+
+        self.spent += units
+        return True
+
+    def charge(self, units):
+        """Account for ``units`` already spent."""
+        self.spent += units
+
+    def save(self):
+        config = self.db.config
+        config.backfill_quota_day = self.day
+        config.backfill_quota_used = self.used_before + self.spent
+        self.db.save_config()
+        self.db.commit()
+
+
+class Backfiller:
+    """
+    Runs the configured backfills in checkpointed chunks within a quota budget.
+
+    A job first scans the channel uploads one page per chunk, newest first, recording every video published since
+    its start date along with the next page token. Once the scan reaches the start date, the recorded videos are
+    queued for insertion oldest first, as many as the budget allows. Every chunk is committed, so an interrupted
+    or throttled job picks up where it stopped on the next run, until it is done.
+    """
+
+    def __init__(self, manager: YoutubeAutoManager, budget: QuotaBudget):
+        self.manager = manager
+        self.db = manager.db
+        self.budget = budget
+
+    def job(self, backfill: Backfill) -> BackfillJob:
+        if (job := self.db.backfill_job(backfill.key)) is None:
+            LOG.green(f"New backfill {backfill.key}")
+            job = BackfillJob(
+                username=self.db.username,
+                job_id=backfill.key,
+                channel_id=backfill.channel_id,
+                since=pendulum.instance(backfill.since).in_tz(LOCAL).naive(),
+                state=BackfillJob.SCANNING,
+                scanned=0,
+                created_at=local_now(),
+            )
+            self.db.add(job)
+        return job
+
+    def scan(self, job: BackfillJob, backfill: Backfill):
+        while job.state == BackfillJob.SCANNING and self.budget.spend(LIST_COST):
+            page = self.manager.yt_api.get_uploads_page(job.channel_id, page_token=job.page_token)
+            items = []
+            reached_since = False
+            for item in page.items:
+                published_at = pendulum.parse(item.contentDetails.videoPublishedAt or item.snippet.publishedAt)
+                if published_at < backfill.since:
+                    reached_since = True
+                    continue
+
+                items.append(
+                    dict(
+                        video_id=item.contentDetails.videoId,
+                        title=item.snippet.title,
+                        published_at=published_at.in_tz(LOCAL).naive(),
+                    ),
+                )
+                job.channel_name = job.channel_name or item.snippet.channelTitle
+
+            with self.db.unit_of_work():
+                self.db.add_backfill_items(job.job_id, items)
+                job.scanned += len(page.items)
+                job.page_token = page.nextPageToken
+                if reached_since or not page.nextPageToken:
+                    LOG.green(f"Backfill {job.job_id}: scan complete after {job.scanned} uploads")
+                    job.state = BackfillJob.INSERTING
+                    job.page_token = None
+                job.updated_at = local_now()
+                self.budget.save()
+
+    def list(self, fnc, *args, **kwargs) -> list:
+        """Call the cached list method ``fnc`` and charge the pages it requested, nothing when it was cached."""
+        flight = self.manager.yt_api.flight(fnc.__name__)
+        executed = flight.stats["executed"]
+        output = fnc(*args, **kwargs)
+        if flight.stats["executed"] > executed:
+            self.budget.charge(LIST_COST * max(1, math.ceil(len(output) / PAGE_SIZE)))
+        return output
+
+    def insert(self, job: BackfillJob, backfill: Backfill) -> str | None:
+        """Queue the pending videos of ``job`` the budget allows for. Return the playlist id they go to."""
+        pending = self.db.backfill_items(job.job_id, state=BackfillItem.PENDING)
+        if not pending or self.budget.remaining < LIST_COST:
+            return None
+
+        # find_playlist gets the playlists from the call cache, filled here unless the run already listed them
+        self.list(self.manager.yt_api.get_playlists)
+        playlist = self.manager.find_playlist(backfill.playlist_id, backfill.playlist_name)
+        if playlist is None:
+            LOG.error(f"Failed to find playlist for backfill {job.job_id}")
+            return None
+
+        playlist_items = self.list(self.manager.yt_api.get_playlist_items, playlist_id=playlist.id)
+        present = {_.contentDetails.videoId for _ in playlist_items}
+        tasks = []
+        with self.db.unit_of_work():
+            for item in pending:
+                if item.video_id in present or self.db.in_ledger(playlist.id, item.video_id):
+                    item.state = BackfillItem.SKIPPED
+                    continue
+
+                if not self.budget.spend(INSERT_COST):
+                    break
+
+                tasks.append(
+                    InsertTask(
+                        video_id=item.video_id,
+                        video_title=item.title,
+                        playlist_id=playlist.id,
+                        playlist_title=playlist.snippet.localized.title,
+                        channel_id=job.channel_id,
+                        channel_name=job.channel_name,
+                        published_at=pendulum.instance(item.published_at, tz=LOCAL),
+                    ),
+                )
+            queued = self.manager.inserts.submit_many(tasks)
+            job.updated_at = local_now()
+            self.budget.save()
+        LOG.green(f"Backfill {job.job_id}: queued {queued}/{len(pending)} videos")
+        return playlist.id
+
+    def finish(self, job: BackfillJob, playlist_id=None):
+        """Mark the videos in the ledger as added or skipped, and the job as done when nothing is left."""
+        with self.db.unit_of_work():
+            for item in self.db.backfill_items(job.job_id, state=BackfillItem.PENDING) if playlist_id else ():
+                if (ledger := self.db.ledger(playlist_id, item.video_id)) is not None:
+                    failed = ledger.state == PlaylistLedger.FAILED
+                    item.state = BackfillItem.SKIPPED if failed else BackfillItem.ADDED
+
+            progress = self.db.backfill_progress(job.job_id)
+            if job.state == BackfillJob.INSERTING and not progress.get(BackfillItem.PENDING):
+                job.state = BackfillJob.DONE
+                job.finished_at = local_now()
+                self.manager.notifier.push(INFO, f"Backfill {job.job_id} done: {describe(self.db, job, progress)}")
+
+    def run(self, backfills: list[Backfill]):
+        if not backfills:
+            return
+
+        LOG.green(f"Running {len(backfills)} backfills with {self.budget.remaining}/{self.budget.limit} quota units")
+        with self.db.unit_of_work():
+            jobs = [(backfill, self.job(backfill)) for backfill in backfills]
+
+        playlists = {}
+        for backfill, job in jobs:
+            if job.state == BackfillJob.DONE:
+                continue
+
+            self.scan(job, backfill)
+            if job.state == BackfillJob.INSERTING and (playlist_id := self.insert(job, backfill)) is not None:
+                playlists[job.job_id] = playlist_id
+
+        self.manager.wait_inserts()
+        for _backfill, job in jobs:
+            if job.state == BackfillJob.INSERTING:
+                self.finish(job, playlists.get(job.job_id))
+            LOG.green(f"Backfill {job.job_id}: {describe(self.db, job)}")
+        LOG.green(f"Backfills spent {self.budget.spent} quota units, {self.budget.remaining} left for today")
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httplib2
+import pendulum
+import requests
+from global_logger import Log
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+LOG = Log.get_logger()
+
+RECORD = "record"
+REPLAY = "replay"
+CASSETTE_VERSION = 1
+REDACTED = "REDACTED"
+# query/form parameters and headers that must never reach a cassette file
+SECRET_PARAMS = frozenset(("access_token", "key", "client_secret", "refresh_token", "code"))
+SECRET_HEADERS = frozenset(("authorization", "cookie", "set-cookie"))
+# parameters that differ between runs by design and are ignored when matching a replayed request
+VOLATILE_PARAMS = frozenset(("publishedAfter", "publishedBefore"))
+# comma-separated parameters whose value order is meaningless: pyyoutube joins ``part`` from a set
+UNORDERED_PARAMS = frozenset(("part",))
+KEPT_RESPONSE_HEADERS = frozenset(("content-type", "etag"))
+
+
+class CassetteError(Exception):
+    pass
+
+
+def _scrub_pairs(pairs):
+    return [(k, REDACTED if k in SECRET_PARAMS else v) for k, v in pairs]
+
+
+def scrub_url(url):
+    parts = urlsplit(url)
+    query = urlencode(_scrub_pairs(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+
+
+def scrub_body(body):
+    if body is None:
+        return None
+
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    try:
+        data = json.loads(body)
+    except ValueError:
+        pairs = parse_qsl(body, keep_blank_values=True)
+        return urlencode(_scrub_pairs(pairs)) if pairs else body
+
+    if isinstance(data, dict):
+        data = {k: REDACTED if k in SECRET_PARAMS else v for k, v in data.items()}
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+def request_key(method, url, body=None):
+    """
+    Build the replay lookup key: method, endpoint, sorted non-secret non-volatile parameters and body.
+
+    Unordered comma-separated values are sorted too, their order changes with the hash seed of the process.
+    """
+    parts = urlsplit(url)
+    params = sorted(
+        (k, ",".join(sorted(v.split(","))) if k in UNORDERED_PARAMS else v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in SECRET_PARAMS and k not in VOLATILE_PARAMS
+    )
+    return f"{method.upper()} {parts.netloc}{parts.path}?{urlencode(params)} {scrub_body(body) or ''}"
+
+
+class Cassette:
+    """
+    Recorded HTTP traffic of a run, stored as gzipped JSON with all credentials scrubbed.
+
+    In record mode every request is sent for real and the scrubbed request, response, and latency are kept.
+    In replay mode no network is touched: requests are answered from the cassette in recorded order per
+    request key, optionally sleeping for the originally recorded latency.
+    """
+
+    def __init__(self, path: str | Path, mode=REPLAY, simulate_latency=False, latency_factor=1.0):
+        self.path = Path(path)
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self.latency_factor = latency_factor
+        self.meta = {}
+        self.interactions = []
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._queues: dict[str, deque] = defaultdict(deque)
+        if mode == REPLAY:
+            self.load()
+        elif mode != RECORD:
+            msg = f"Unknown cassette mode {mode}"
+            raise CassetteError(msg)
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    def load(self):
+        with gzip.open(self.path, mode="rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if (version := data.get("version")) != CASSETTE_VERSION:
+            msg = f"Unsupported cassette version {version} @ {self.path}"
+            raise CassetteError(msg)
+
+        self.meta = data.get("meta", {})
+        self.interactions = data.get("interactions", [])
+        self._queues.clear()
+        for interaction in self.interactions:
+            key = request_key(interaction["method"], interaction["url"], interaction["body"])
+            self._queues[key].append(interaction)
+        LOG.green(f"Loaded {len(self.interactions)} interactions from cassette {self.path}")
+
+    def save(self):
+        self.meta.setdefault("recorded_at", pendulum.now().to_iso8601_string())
+        data = {"version": CASSETTE_VERSION, "meta": self.meta, "interactions": self.interactions}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.path, mode="wt", encoding="utf-8", compresslevel=9) as f:
+            json.dump(data, f, separators=(",", ":"))
+        LOG.green(f"Saved {len(self.interactions)} interactions to cassette {self.path}")
+
+    def record(self, method, url, body, status, headers, content: bytes, elapsed: float):  # noqa: PLR0913, PLR0917
+        headers = {
+            k.lower(): v
+            for k, v in (headers or {}).items()
+            if k.lower() in KEPT_RESPONSE_HEADERS and k.lower() not in SECRET_HEADERS
+        }
+        interaction = {
+            "method": method.upper(),
+            "url": scrub_url(url),
+            "body": scrub_body(body),
+            "status": int(status),
+            "headers": headers,
+            "content": content.decode("utf-8", errors="replace"),
+            "elapsed": round(elapsed, 4),
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def play(self, method, url, body=None) -> dict:
+        key = request_key(method, url, body)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                self.misses += 1
+                msg = f"No recorded interaction for {key}"
+                raise CassetteError(msg)
+
+            interaction = queue.popleft() if len(queue) > 1 else queue[0]
+        if self.simulate_latency:
+            time.sleep(interaction["elapsed"] * self.latency_factor)
+        return interaction
+
+    @property
+    def recorded_latency(self):
+        return sum(i["elapsed"] for i in self.interactions)
+
+    @property
+    def start_date(self) -> datetime | None:
+        if (start_date := self.meta.get("start_date")) is None:
+            return None
+
+        return pendulum.parse(start_date)
+
+    def requests_adapter(self) -> CassetteAdapter:
+        return CassetteAdapter(self)
+
+    def http(self) -> CassetteHttp:
+        return CassetteHttp(self)
+
+
+class CassetteAdapter(HTTPAdapter):
+    """requests transport adapter, mounted on the pyyoutube ``Api.session``."""
+
+    def __init__(self, cassette: Cassette, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        if self.cassette.recording:
+            started = time.perf_counter()
+            response = super().send(request, **kwargs)
+            elapsed = time.perf_counter() - started
+            self.cassette.record(
+                request.method,
+                request.url,
+                request.body,
+                response.status_code,
+                response.headers,
+                response.content,
+                elapsed,
+            )
+            return response
+
+        interaction = self.cassette.play(request.method, request.url, request.body)
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response._content = interaction["content"].encode("utf-8")  # noqa: SLF001
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        return response
+
+
+class CassetteHttp:
+    """httplib2.Http stand-in for the googleapiclient client."""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._http = httplib2.Http() if cassette.recording else None
+
+    def request(  # noqa: PLR0913, PLR0917
+        self,
+        uri,
+        method="GET",
+        body=None,
+        headers=None,
+        redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+        connection_type=None,
+    ):
+        if self.cassette.recording:
+            started = time.perf_counter()
+            response, content = self._http.request(uri, method, body, headers, redirections, connection_type)
+            elapsed = time.perf_counter() - started
+            self.cassette.record(method, uri, body, response.status, response, content, elapsed)
+            return response, content
+
+        interaction = self.cassette.play(method, uri, body)
+        response = httplib2.Response({"status": interaction["status"], **interaction["headers"]})
+        return response, interaction["content"].encode("utf-8")
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+import json
+import re
 from datetime import datetime
 from functools import cached_property
 from pathlib import Path
@@ -10,14 +12,170 @@ from global_logger import Log
 
 from youtube_automanager import constants
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
 log = Log.get_logger()
 
 
+def _as_list(value):
+    if not value:
+        return []
+
+    return value if isinstance(value, list) else [value]
+
+
+class Rule:
+    """Compiled config rule: patterns are compiled once and reused until the rule itself changes."""
+
+    def __init__(self, rule: dict):
+        self.raw = rule
+        self.key = json.dumps(rule, sort_keys=True, default=str)
+        self.channel_ids = frozenset(_as_list(rule.get("channel_id")))
+        self.channel_names = tuple(re.compile(_) for _ in _as_list(rule.get("channel_name")))
+        self.video_title_patterns = tuple(
+            re.compile(_, flags=re.IGNORECASE) for _ in _as_list(rule.get("video_title_pattern"))
+        )
+        self.playlist_id = rule.get("playlist_id")
+        self.playlist_name = rule.get("playlist_name")
+
+    @classmethod
+    def compile(cls, rule) -> Rule | None:
+        if not isinstance(rule, dict):
+            log.error(f"Rule is not a mapping:\n{rule}")
+            return None
+
+        if not any((rule.get("channel_id"), rule.get("channel_name"))):
+            log.error(f"Rule has no channel_id or channel_name:\n{rule}")
+            return None
+
+        if not any((rule.get("playlist_id"), rule.get("playlist_name"))):
+            log.error(f"Rule has no playlist_id or playlist_name:\n{rule}")
+            return None
+
+        try:
+            return cls(rule)
+        except re.error as e:
+            log.exception(f"Rule has an invalid pattern:\n{rule}", exc_info=e)
+            return None
+
+    @property
+    def channel_id_only(self):
+        return not self.channel_names and not self.video_title_patterns
+
+    def matches(self, video_id, channel_id, channel_name, title):
+        rule_channel_ids = self.raw.get("channel_id")
+        rule_channel_names = self.raw.get("channel_name")
+        rule_video_title_patterns = self.raw.get("video_title_pattern")
+        match = False
+        if channel_id in self.channel_ids:
+            log.debug(f"Video {video_id} '{title}' channel id matches rule: {channel_id}")
+            match = True
+        else:
+            log.debug(f"Video {video_id} '{title}' doesn't match any of the rule channel ids: {rule_channel_ids}")
+
+        if self.channel_names and any(_.match(channel_name) for _ in self.channel_names):
+            log.debug(f"Video {video_id} '{title}' matches rule channel name: {channel_name}")
+            match = True
+        else:
+            log.debug(f"Video {video_id} '{title}' doesn't match any of the rule channel names: {rule_channel_names}")
+
+        if self.video_title_patterns and any(_.search(title) for _ in self.video_title_patterns):
+            log.debug(f"Video {video_id} '{title}' matches rule pattern {rule_video_title_patterns}")
+            match = True
+        else:
+            log.debug(
+                f"Video {video_id} '{title}' title does not match any of the patterns {rule_video_title_patterns}",
+            )
+
+        return match
+
+
+class Backfill:
+    """Historical catch-up job: add every upload of ``channel_id`` published since ``since`` to the playlist."""
+
+    def __init__(self, spec: dict, since: datetime):
+        self.raw = spec
+        self.channel_id = spec["channel_id"]
+        self.playlist_id = spec.get("playlist_id")
+        self.playlist_name = spec.get("playlist_name")
+        self.since = since
+        self.key = f"{self.channel_id}:{self.playlist_id or self.playlist_name}:{since.to_iso8601_string()}"
+
+    @classmethod
+    def compile(cls, spec) -> Backfill | None:
+        if not isinstance(spec, dict):
+            log.error(f"Backfill is not a mapping:\n{spec}")
+            return None
+
+        if not spec.get("channel_id"):
+            log.error(f"Backfill has no channel_id:\n{spec}")
+            return None
+
+        if not any((spec.get("playlist_id"), spec.get("playlist_name"))):
+            log.error(f"Backfill has no playlist_id or playlist_name:\n{spec}")
+            return None
+
+        try:
+            since = pendulum.instance(datetime.fromisoformat(str(spec.get("since"))))
+        except Exception as e:
+            log.exception(f"Failed to parse backfill since {spec.get('since')}. Please use ISO8601 format", exc_info=e)
+            return None
+
+        return cls(spec, since)
+
+    def __repr__(self):
+        return f"Backfill({self.key!r})"
+
+
+class RuleSet:
+    """
+    Immutable, indexed collection of compiled rules.
+
+    Rules keyed on channel ids only are looked up by channel id, the rest are scanned.
+    Matches are returned in config order.
+    """
+
+    def __init__(self, rules: list[Rule] | tuple[Rule, ...] = ()):
+        self.rules = tuple(rules)
+        self._by_key = {rule.key: rule for rule in self.rules}
+        self._by_channel_id: dict[str, list[int]] = {}
+        self._scan: list[int] = []
+        for i, rule in enumerate(self.rules):
+            if not rule.channel_id_only:
+                self._scan.append(i)
+                continue
+
+            for channel_id in rule.channel_ids:
+                self._by_channel_id.setdefault(channel_id, []).append(i)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def get(self, key) -> Rule | None:
+        return self._by_key.get(key)
+
+    def candidates(self, channel_id) -> list[Rule]:
+        indexes = sorted((*self._by_channel_id.get(channel_id, ()), *self._scan))
+        return [self.rules[i] for i in indexes]
+
+    def match(self, video_id, channel_id, channel_name, title) -> list[Rule]:
+        return [_ for _ in self.candidates(channel_id) if _.matches(video_id, channel_id, channel_name, title)]
+
+
 class YoutubeAutoManagerConfig:
     def __init__(self, config_filepath=constants.CONFIG_FILEPATH):
         self.config_filepath = Path(config_filepath)
         self.__auth_file = None
         self.start_date: pendulum.DateTime | None = None
+        self.rules: RuleSet = RuleSet()
+        self.backfills: list[Backfill] = []
+        self._stat = None
 
     @property
     def ok(self):
@@ -25,10 +183,18 @@ class YoutubeAutoManagerConfig:
         if config is None:
             return False
 
+        return self._apply(config)
+
+    def _apply(self, config) -> bool:
+        """Validate ``config`` and swap it in, recompiling only the rules that changed."""
+        if not isinstance(config, dict):
+            log.error(f"Config @ {self.config_filepath} is not a mapping")
+            return False
+
         start_date = config.get("start_date", None)
         if start_date is not None:
             try:
-                self.start_date = pendulum.instance(datetime.fromisoformat(start_date))
+                start_date = pendulum.instance(datetime.fromisoformat(str(start_date)))
             except Exception as e:
                 log.exception(f"Failed to parse start_date {start_date}. Please use ISO8601 format", exc_info=e)
                 return False
@@ -38,33 +204,79 @@ class YoutubeAutoManagerConfig:
             log.error(f"No rules found in config @ {self.config_filepath}")
             return False
 
+        compiled = []
+        recompiled = 0
         for rule in rules:
-            if not any((rule.get("channel_id"), rule.get("channel_name"))):
-                log.error(f"Rule has no channel_id or channel_name:\n{rule}")
-                return False
+            key = json.dumps(rule, sort_keys=True, default=str)
+            if (rule_ := self.rules.get(key)) is None:
+                if (rule_ := Rule.compile(rule)) is None:
+                    return False
+
+                recompiled += 1
+            compiled.append(rule_)
 
-            if not any((rule.get("playlist_id"), rule.get("playlist_name"))):
-                log.error(f"Rule has no playlist_id or playlist_name:\n{rule}")
+        backfills = []
+        for spec in _as_list(config.get("backfill")):
+            if (backfill := Backfill.compile(spec)) is None:
                 return False
 
+            backfills.append(backfill)
+
+        self.start_date = start_date
+        self.backfills = backfills
+        self.rules = RuleSet(compiled)
+        self.__dict__["config"] = config
+        log.debug(f"Loaded {len(compiled)} rules, {recompiled} of them recompiled")
         return True
 
+    def _file_stat(self):
+        try:
+            stat = self.config_filepath.stat()
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
     def _config(self):
         path = self.config_filepath
         if not path or not path.exists():
             log.error(f"Config file {path} not found")
             return None
 
+        self._stat = self._file_stat()
         with path.open(mode="r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=SafeLoader)
 
     @cached_property
     def config(self):
         return self._config()
 
     def re_read_config(self):
-        del self.__dict__["config"]
-        _ = self.config
+        self.__dict__.pop("config", None)
+        if (config := self.config) is not None:
+            self._apply(config)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Re-read the config file if it changed on disk since it was last read.
+
+        A config that fails to parse or validate is logged and the previous rule set stays live.
+        """
+        if (stat := self._file_stat()) is None or stat == self._stat:
+            return False
+
+        log.green(f"Config file {self.config_filepath} changed, reloading")
+        try:
+            config = self._config()
+        except yaml.YAMLError as e:
+            log.exception(f"Failed to parse config @ {self.config_filepath}, keeping the previous rules", exc_info=e)
+            return False
+
+        if not self._apply(config):
+            log.error(f"Config @ {self.config_filepath} is not ok, keeping the previous rules")
+            return False
+
+        return True
 
 
 def main():
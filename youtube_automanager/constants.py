@@ -39,6 +39,31 @@ HOST = os.getenv("HOST", "localhost")
 SCOPES = os.getenv("SCOPES", YOUTUBE_READ_WRITE_SCOPE)
 SCOPES = SCOPES.split(",")
 REDIRECT_URI = os.getenv("REDIRECT_URI")
+# playlists written in parallel, inserts into the same playlist are always sequential
+INSERT_WORKERS = int(os.getenv("INSERT_WORKERS", "4"))
+# API quota units per day of the Google Cloud project, and the share of it backfills may use per run and per day
+DAILY_QUOTA = int(os.getenv("DAILY_QUOTA", "10000"))
+BACKFILL_QUOTA_SHARE = float(os.getenv("BACKFILL_QUOTA_SHARE", "0.25"))
+
+# record the API traffic of a run into a cassette @ HOME for offline replay
+CASSETTE_RECORD = os.getenv("CASSETTE_RECORD") == "True"
+CASSETTE_FILENAME = os.getenv("CASSETTE_FILENAME", f"{FILENAME_BASE}.cassette.json.gz")
+CASSETTE_FILEPATH = HOME / CASSETTE_FILENAME
+
+# sample the run per phase and write the profiles and a flamegraph collapsed-stack file into PROFILE_FOLDER
+PROFILE = os.getenv("PROFILE") == "True"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+PROFILE_FOLDER = HOME / "logs"
+
+# WebSub push ingestion: subscribe followed channels at the hub and process uploads as they are announced
+WEBSUB = os.getenv("WEBSUB") == "True"
+WEBSUB_HUB_URL = os.getenv("WEBSUB_HUB_URL", "https://pubsubhubbub.appspot.com/subscribe")
+WEBSUB_CALLBACK_URL = os.getenv("WEBSUB_CALLBACK_URL")
+WEBSUB_HOST = os.getenv("WEBSUB_HOST", "0.0.0.0")
+WEBSUB_PORT = int(os.getenv("WEBSUB_PORT", "8081"))
+WEBSUB_LEASE_SECONDS = int(os.getenv("WEBSUB_LEASE_SECONDS", str(5 * 24 * 60 * 60)))
+# polling run that reconciles anything the hub missed and renews the leases, seconds
+WEBSUB_RECONCILE_INTERVAL = int(os.getenv("WEBSUB_RECONCILE_INTERVAL", str(60 * 60)))
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
@@ -49,3 +74,5 @@ SLACK_CHANNEL = os.getenv("SLACK_CHANNEL")
 SLACK_USER_MENTIONS = os.getenv("SLACK_USER_MENTIONS", "")
 TEAMS_WEBHOOK_URL = os.getenv("TEAMS_WEBHOOK_URL")
 TEAMS_USER_MENTIONS = os.getenv("TEAMS_USER_MENTIONS", "")
+# send the notification digest every this many seconds instead of once per run
+NOTIFY_INTERVAL = int(os.getenv("NOTIFY_INTERVAL", "0")) or None
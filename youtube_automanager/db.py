@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+import contextlib
 from collections.abc import Iterable
 from datetime import datetime
-from functools import cached_property
+from functools import cache, cached_property
 from pathlib import Path
 
 import pendulum
 from global_logger import Log
-from sqlalchemy import Column, create_engine, String, update, DateTime
+from sqlalchemy import Column, create_engine, DateTime, event, Float, func, inspect, Integer, String
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
@@ -19,6 +21,25 @@ LOG = Log.get_logger()
 # https://leportella.com/sqlalchemy-tutorial/
 Base = declarative_base()
 
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64_000,  # KiB
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": 10_000,  # ms
+}
+LOCAL = pendulum.local_timezone()
+
+
+# sqlite keeps local naive datetimes
+def local_now() -> datetime:
+    return datetime.now(tz=LOCAL).replace(tzinfo=None)
+
+
+def as_local(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=LOCAL) if dt.tzinfo is None else dt
+
 
 class YAMConfig(Base):
     __tablename__ = "config"
@@ -26,33 +47,169 @@ class YAMConfig(Base):
 
     username = Column(INDEX_NAME, String(50), primary_key=True)
     refresh_token = Column("refresh_token", String, nullable=True)
+    access_token = Column("access_token", String, nullable=True)
+    token_expires_at = Column("token_expires_at", DateTime, nullable=True)
     last_update = Column("last_update", DateTime, default=datetime.now(tz=pendulum.local_timezone()))
+    # quota units spent by backfills on ``backfill_quota_day`` (API quota days start at Pacific midnight)
+    backfill_quota_day = Column("backfill_quota_day", String(10), nullable=True)
+    backfill_quota_used = Column("backfill_quota_used", Integer, nullable=True)
 
     @classmethod
     def instantiate(cls, session, username):
-        candidate = session.query(cls).filter_by(username=username)
-        if candidate.count() != 0:
-            return candidate.first()
+        if (output := session.get(cls, username)) is not None:
+            return output
 
-        session.add(cls(username=username))
-        if not session.dirty:
-            session.commit()
-        return cls.instantiate(session, username)
+        output = cls(username=username)
+        session.add(output)
+        session.flush()
+        return output
 
-    @property
-    def items(self):
-        return {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+    def save(self, session):
+        # the instance is tracked by the session: changed columns are flushed with the surrounding transaction
+        session.add(self)
 
-    @property
-    def updatable_items(self):
-        return {k: v for k, v in self.items.items() if k != self.INDEX_NAME}
 
-    def save(self, session):
-        stmt = update(YAMConfig).where(YAMConfig.username == self.username).values(**self.updatable_items)
-        commit = not session.dirty
-        session.execute(stmt)
-        if commit:
-            session.commit()
+class PlaylistLedger(Base):
+    """Videos added to playlists by the manager, and videos that can never be added."""
+
+    __tablename__ = "playlist_ledger"
+    ADDED = "added"
+    FAILED = "failed"
+
+    username = Column("username", String(50), primary_key=True)
+    playlist_id = Column("playlist_id", String, primary_key=True)
+    video_id = Column("video_id", String, primary_key=True)
+    channel_id = Column("channel_id", String, nullable=True)
+    published_at = Column("published_at", DateTime, nullable=True)
+    added_at = Column("added_at", DateTime, nullable=False)
+    # rows written before states were tracked are added videos
+    state = Column("state", String(16), nullable=True)
+    error = Column("error", String, nullable=True)
+
+
+class ChannelWatermark(Base):
+    """Per-channel high-water mark: everything published before ``checked_at`` has been processed."""
+
+    __tablename__ = "channel_watermark"
+
+    username = Column("username", String(50), primary_key=True)
+    channel_id = Column("channel_id", String, primary_key=True)
+    channel_name = Column("channel_name", String, nullable=True)
+    checked_at = Column("checked_at", DateTime, nullable=False)
+    last_published_at = Column("last_published_at", DateTime, nullable=True)
+    last_video_id = Column("last_video_id", String, nullable=True)
+    # uploads per day, smoothed over the runs
+    upload_rate = Column("upload_rate", Float, nullable=True)
+
+
+class PlaylistSnapshot(Base):
+    """Playlist of the user as last listed, for planning without calling the API."""
+
+    __tablename__ = "playlist_snapshot"
+
+    username = Column("username", String(50), primary_key=True)
+    playlist_id = Column("playlist_id", String, primary_key=True)
+    title = Column("title", String, nullable=True)
+    item_count = Column("item_count", Integer, nullable=True)
+    updated_at = Column("updated_at", DateTime, nullable=False)
+
+
+class WebSubSubscription(Base):
+    """Channel feed subscription at a WebSub hub and its lease."""
+
+    __tablename__ = "websub_subscription"
+    PENDING = "pending"
+    SUBSCRIBED = "subscribed"
+    UNSUBSCRIBING = "unsubscribing"
+    UNSUBSCRIBED = "unsubscribed"
+
+    username = Column("username", String(50), primary_key=True)
+    channel_id = Column("channel_id", String, primary_key=True)
+    topic = Column("topic", String, nullable=False, index=True)
+    secret = Column("secret", String, nullable=False)
+    state = Column("state", String(16), nullable=False)
+    requested_at = Column("requested_at", DateTime, nullable=True)
+    verified_at = Column("verified_at", DateTime, nullable=True)
+    lease_expires_at = Column("lease_expires_at", DateTime, nullable=True)
+
+
+class BackfillJob(Base):
+    """Checkpoint of a historical catch-up of a channel into a playlist."""
+
+    __tablename__ = "backfill_job"
+    SCANNING = "scanning"
+    INSERTING = "inserting"
+    DONE = "done"
+
+    username = Column("username", String(50), primary_key=True)
+    job_id = Column("job_id", String, primary_key=True)
+    channel_id = Column("channel_id", String, nullable=False)
+    channel_name = Column("channel_name", String, nullable=True)
+    since = Column("since", DateTime, nullable=False)
+    state = Column("state", String(16), nullable=False)
+    # next page of the channel uploads to scan
+    page_token = Column("page_token", String, nullable=True)
+    scanned = Column("scanned", Integer, nullable=False, default=0)
+    created_at = Column("created_at", DateTime, nullable=False)
+    updated_at = Column("updated_at", DateTime, nullable=True)
+    finished_at = Column("finished_at", DateTime, nullable=True)
+
+
+class BackfillItem(Base):
+    """Video found by a backfill scan, waiting to be added to the playlist."""
+
+    __tablename__ = "backfill_item"
+    PENDING = "pending"
+    ADDED = "added"
+    SKIPPED = "skipped"
+
+    username = Column("username", String(50), primary_key=True)
+    job_id = Column("job_id", String, primary_key=True)
+    video_id = Column("video_id", String, primary_key=True)
+    title = Column("title", String, nullable=True)
+    published_at = Column("published_at", DateTime, nullable=False)
+    state = Column("state", String(16), nullable=False)
+
+
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def _add_missing_columns(engine):
+    """Bring tables created by older versions up to date: new nullable columns are added in place."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {_["name"] for _ in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                if not column.nullable:
+                    LOG.error(f"Cannot add non-nullable column {table.name}.{column.name} to an existing table")
+                    continue
+
+                column_type = column.type.compile(dialect=engine.dialect)
+                LOG.green(f"Adding column {table.name}.{column.name} {column_type}")
+                connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+
+
+@cache
+def get_engine(db_filepath: Path):
+    """One pooled engine per database file, shared by every controller of the process."""
+    engine_str = rf"sqlite:///{db_filepath}"
+    LOG.green(f"Opening database {engine_str}")
+    engine = create_engine(engine_str)  # , echo=log.verbose)
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    _add_missing_columns(engine)
+    Base.metadata.create_all(engine)
+    return engine
 
 
 class DatabaseController:
@@ -60,17 +217,48 @@ class DatabaseController:
         self.db_filepath: Path = Path(db_filepath)
         self.username: str = username
         self._config = None
+        self._uow_depth = 0
+
+    @cached_property
+    def engine(self):
+        return get_engine(self.db_filepath.resolve())
 
     @cached_property
     def db(self) -> Session:
-        engine_str = rf"sqlite:///{self.db_filepath}"
-        LOG.green(f"Opening database {engine_str}")
-        engine = create_engine(engine_str)  # , echo=log.verbose)
-        Base.metadata.create_all(engine)
-        session = sessionmaker(bind=engine)()
+        session = sessionmaker(bind=self.engine, expire_on_commit=False)()
         return session
 
+    @property
+    def in_unit_of_work(self):
+        return self._uow_depth > 0
+
+    @contextlib.contextmanager
+    def unit_of_work(self):
+        """
+        Group every state change made inside into a single transaction.
+
+        Nested units join the outermost one; ``commit`` calls inside only flush.
+        The transaction is committed when the outermost unit exits and rolled back if it raises.
+        """
+        self._uow_depth += 1
+        try:
+            yield self.db
+        except BaseException:
+            self._uow_depth -= 1
+            if not self.in_unit_of_work:
+                LOG.debug("Rolling back database changes")
+                self.db.rollback()
+            raise
+
+        self._uow_depth -= 1
+        if not self.in_unit_of_work:
+            self.db.commit()
+
     def commit(self):
+        if self.in_unit_of_work:
+            self.db.flush()
+            return
+
         LOG.green("Saving database")
         self.db.commit()
 
@@ -91,7 +279,153 @@ class DatabaseController:
         return self._config
 
     def save_config(self):
-        self._config.save(self.db)
+        self.config.save(self.db)
+
+    def upsert(self, model, rows: list[dict], update_columns: Iterable[str] | None = None):
+        """
+        Bulk ``INSERT ... ON CONFLICT DO UPDATE`` of ``rows`` into ``model`` on its primary key.
+
+        Only ``update_columns`` (default: every non-key column present in the rows) are overwritten on conflict.
+        The rows go through one executemany of a single-row statement, so the sqlite variable limit never applies.
+        """
+        if not rows:
+            return
+
+        keys = [c.name for c in model.__table__.primary_key.columns]
+        if update_columns is None:
+            update_columns = [k for k in rows[0] if k not in keys]
+        stmt = insert(model)
+        if update_columns := list(update_columns):
+            stmt = stmt.on_conflict_do_update(
+                index_elements=keys,
+                set_={c: stmt.excluded[c] for c in update_columns},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+
+        with self.unit_of_work() as session:
+            session.connection().execute(stmt, rows)
+
+    def watermarks(self) -> dict[str, ChannelWatermark]:
+        query = self.db.query(ChannelWatermark).filter_by(username=self.username)
+        return {_.channel_id: _ for _ in query}
+
+    def watermark(self, channel_id) -> ChannelWatermark | None:
+        return self.db.get(ChannelWatermark, (self.username, channel_id))
+
+    def advance_watermark(  # noqa: PLR0913
+        self,
+        channel_id,
+        checked_at,
+        channel_name=None,
+        last_published_at=None,
+        last_video_id=None,
+        upload_rate=None,
+    ):
+        """Move the channel watermark forward, keeping the last seen video if none newer was seen."""
+        stmt = insert(ChannelWatermark).values(
+            username=self.username,
+            channel_id=channel_id,
+            channel_name=channel_name,
+            checked_at=checked_at,
+            last_published_at=last_published_at,
+            last_video_id=last_video_id,
+            upload_rate=upload_rate,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChannelWatermark.username, ChannelWatermark.channel_id],
+            set_={
+                "channel_name": func.coalesce(stmt.excluded.channel_name, ChannelWatermark.channel_name),
+                "checked_at": stmt.excluded.checked_at,
+                "last_published_at": func.coalesce(stmt.excluded.last_published_at, ChannelWatermark.last_published_at),
+                "last_video_id": func.coalesce(stmt.excluded.last_video_id, ChannelWatermark.last_video_id),
+                "upload_rate": func.coalesce(stmt.excluded.upload_rate, ChannelWatermark.upload_rate),
+            },
+        )
+        with self.unit_of_work() as session:
+            session.connection().execute(stmt)
+
+    def playlist_snapshots(self) -> dict[str, PlaylistSnapshot]:
+        query = self.db.query(PlaylistSnapshot).filter_by(username=self.username)
+        return {_.playlist_id: _ for _ in query}
+
+    def save_playlist_snapshots(self, playlists: Iterable[tuple[str, str, int | None]]):
+        """Replace the snapshot of the user playlists with ``(playlist_id, title, item_count)`` rows."""
+        now = datetime.now(tz=pendulum.local_timezone())
+        rows = [
+            dict(username=self.username, playlist_id=_id, title=title, item_count=item_count, updated_at=now)
+            for _id, title, item_count in playlists
+        ]
+        with self.unit_of_work():
+            self.db.query(PlaylistSnapshot).filter_by(username=self.username).delete()
+            self.upsert(PlaylistSnapshot, rows)
+
+    def ledger(self, playlist_id, video_id) -> PlaylistLedger | None:
+        return self.db.get(PlaylistLedger, (self.username, playlist_id, video_id))
+
+    def in_ledger(self, playlist_id, video_id):
+        """Whether the video was added to the playlist, or failed for good and must not be retried."""
+        return self.ledger(playlist_id, video_id) is not None
+
+    # subscriptions are also written by the WebSub server thread: always reload them from the database
+    def websub_subscriptions(self) -> dict[str, WebSubSubscription]:
+        query = self.db.query(WebSubSubscription).filter_by(username=self.username).populate_existing()
+        return {_.channel_id: _ for _ in query}
+
+    def websub_subscription(self, channel_id) -> WebSubSubscription | None:
+        return self.db.get(WebSubSubscription, (self.username, channel_id), populate_existing=True)
+
+    def websub_subscription_by_topic(self, topic) -> WebSubSubscription | None:
+        query = self.db.query(WebSubSubscription).filter_by(username=self.username, topic=topic)
+        return query.populate_existing().first()
+
+    def backfill_jobs(self) -> dict[str, BackfillJob]:
+        query = self.db.query(BackfillJob).filter_by(username=self.username)
+        return {_.job_id: _ for _ in query}
+
+    def backfill_job(self, job_id) -> BackfillJob | None:
+        return self.db.get(BackfillJob, (self.username, job_id))
+
+    def backfill_items(self, job_id, state=None) -> list[BackfillItem]:
+        """Items of a backfill job, oldest first."""
+        query = self.db.query(BackfillItem).filter_by(username=self.username, job_id=job_id)
+        if state is not None:
+            query = query.filter_by(state=state)
+        return query.order_by(BackfillItem.published_at, BackfillItem.video_id).all()
+
+    def backfill_progress(self, job_id) -> dict[str, int]:
+        query = (
+            self.db.query(BackfillItem.state, func.count())
+            .filter_by(username=self.username, job_id=job_id)
+            .group_by(BackfillItem.state)
+        )
+        return dict(query.all())
+
+    def add_backfill_items(self, job_id, items: Iterable[dict]):
+        """Record scanned videos. Videos already recorded keep their state, a page can safely be scanned twice."""
+        rows = [dict(username=self.username, job_id=job_id, state=BackfillItem.PENDING, **_) for _ in items]
+        self.upsert(BackfillItem, rows, update_columns=())
+
+    def add_ledger(  # noqa: PLR0913
+        self,
+        playlist_id,
+        video_id,
+        channel_id=None,
+        published_at=None,
+        state=PlaylistLedger.ADDED,
+        error=None,
+    ):
+        row = dict(
+            username=self.username,
+            playlist_id=playlist_id,
+            video_id=video_id,
+            channel_id=channel_id,
+            published_at=published_at,
+            added_at=datetime.now(tz=pendulum.local_timezone()),
+            state=state,
+            error=error,
+        )
+        self.upsert(PlaylistLedger, [row])
 
 
 def main():
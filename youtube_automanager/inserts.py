@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from global_logger import Log
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+    from datetime import datetime
+
+LOG = Log.get_logger()
+
+
+class InsertCancelledError(Exception):
+    """The task was dropped from the queue before it ran."""
+
+
+class InsertTask:
+    """Video waiting to be added to a playlist."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        video_id,
+        video_title,
+        playlist_id,
+        playlist_title,
+        channel_id,
+        channel_name,
+        published_at: datetime,
+    ):
+        self.video_id = video_id
+        self.video_title = video_title
+        self.playlist_id = playlist_id
+        self.playlist_title = playlist_title
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.published_at = published_at
+
+    @property
+    def key(self):
+        return self.playlist_id, self.video_id
+
+    def __repr__(self):
+        return f"InsertTask({self.video_id!r} -> {self.playlist_id!r})"
+
+
+class PlaylistStats:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    @property
+    def wall(self):
+        if self.started is None or self.finished is None:
+            return 0.0
+
+        return self.finished - self.started
+
+    @property
+    def rate(self):
+        return self.inserted / self.wall if self.wall else 0.0
+
+
+class InsertExecutor:
+    """
+    Adds videos to playlists in the background.
+
+    Each playlist has its own queue, drained by at most one writer at a time in publish date order,
+    while different playlists are written in parallel by up to ``max_workers`` threads.
+    Tasks submitted together with ``submit_many`` are all queued before any of them is written,
+    so a batch keeps its publish date order whatever order its tasks were found in.
+    Finished tasks are collected by the owner thread with ``completed``.
+    """
+
+    def __init__(self, insert: Callable[[InsertTask], object], max_workers=4):
+        self.insert = insert
+        self.max_workers = max_workers
+        self.stats: dict[str, PlaylistStats] = defaultdict(PlaylistStats)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="insert")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queues: dict[str, list] = defaultdict(list)
+        self._active: set[str] = set()
+        self._seen: set[tuple[str, str]] = set()
+        self._pending_channels: Counter[str] = Counter()
+        self._completed: list[tuple[InsertTask, Exception | None]] = []
+        self._sequence = itertools.count()
+
+    def submit(self, task: InsertTask) -> bool:
+        """Queue ``task``, unless the same video is already queued or added to the same playlist."""
+        return self.submit_many([task]) > 0
+
+    def submit_many(self, tasks: Iterable[InsertTask]) -> int:
+        """Queue ``tasks`` as one batch, skipping the videos already queued or added. Return how many were queued."""
+        tasks = list(tasks)
+        queued = 0
+        with self._lock:
+            playlists = []
+            for task in tasks:
+                if task.key in self._seen:
+                    continue
+
+                self._seen.add(task.key)
+                self._pending_channels[task.channel_id] += 1
+                heapq.heappush(self._queues[task.playlist_id], (task.published_at, next(self._sequence), task))
+                if task.playlist_id not in self._active:
+                    self._active.add(task.playlist_id)
+                    playlists.append(task.playlist_id)
+                queued += 1
+            # writers start once the whole batch is queued
+            for playlist_id in playlists:
+                self._pool.submit(self._drain, playlist_id)
+        return queued
+
+    def _drain(self, playlist_id):
+        stats = self.stats[playlist_id]
+        while True:
+            with self._lock:
+                queue = self._queues[playlist_id]
+                if not queue:
+                    self._active.discard(playlist_id)
+                    self._idle.notify_all()
+                    return
+
+                _, _, task = heapq.heappop(queue)
+
+            started = time.perf_counter()
+            error = None
+            try:
+                self.insert(task)
+            except Exception as e:  # noqa: BLE001
+                error = e
+            finished = time.perf_counter()
+
+            with self._lock:
+                stats.started = started if stats.started is None else stats.started
+                stats.finished = finished
+                stats.busy += finished - started
+                if error is None:
+                    stats.inserted += 1
+                else:
+                    stats.failed += 1
+                    self._seen.discard(task.key)
+                self._pending_channels[task.channel_id] -= 1
+                self._completed.append((task, error))
+
+    def pending(self, channel_id) -> int:
+        with self._lock:
+            return self._pending_channels[channel_id]
+
+    def completed(self) -> list[tuple[InsertTask, Exception | None]]:
+        with self._lock:
+            output, self._completed = self._completed, []
+        return output
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until every queued task is done. Return whether they are."""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._active, timeout=timeout)
+
+    def cancel(self) -> int:
+        """Drop the queued tasks that have not started yet, they complete with ``InsertCancelledError``."""
+        dropped = 0
+        with self._lock:
+            for queue in self._queues.values():
+                for _, _, task in queue:
+                    self._seen.discard(task.key)
+                    self._pending_channels[task.channel_id] -= 1
+                    self._completed.append((task, InsertCancelledError(f"{task} dropped on shutdown")))
+                    dropped += 1
+                queue.clear()
+        return dropped
+
+    def shutdown(self, timeout: float | None = None):
+        """Drop the queued tasks, give the running ones ``timeout`` seconds to finish and stop the workers."""
+        if dropped := self.cancel():
+            LOG.yellow(f"Dropped {dropped} queued inserts")
+        if not self.join(timeout):
+            LOG.yellow(f"Inserts still running after {timeout}s, not waiting for them")
+        self._pool.shutdown(wait=False)
+
+    def log_stats(self):
+        for playlist_id, stats in self.stats.items():
+            LOG.green(
+                f"Playlist {playlist_id}: {stats.inserted} inserted, {stats.failed} failed "
+                f"in {stats.wall:.1f}s ({stats.rate:.2f}/s, busy {stats.busy:.1f}s)",
+            )
+        self.stats.clear()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import abc
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import pendulum
+import requests
+from global_logger import Log
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from youtube_automanager import constants
+
+LOG = Log.get_logger()
+
+VIDEO_ADDED = "video_added"
+QUOTA_WARNING = "quota_warning"
+ERROR = "error"
+INFO = "info"
+# digest sections, in order
+SECTIONS = {
+    ERROR: "Errors",
+    QUOTA_WARNING: "Quota warnings",
+    VIDEO_ADDED: "Videos added",
+    INFO: "Info",
+}
+MAX_SECTION_LINES = 20
+HTTP_TIMEOUT = 10
+RETRY = Retry(
+    total=3,
+    backoff_factor=1,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(("POST",)),
+)
+_FLUSH = object()
+_STOP = object()
+
+
+class Sink(abc.ABC):
+    """
+    Chat webhook a message can be posted to.
+
+    ``digests`` sinks receive the aggregated digests, ``alerts`` sinks the messages that can't wait for one.
+    """
+
+    name = "sink"
+
+    def __init__(self, digests=True, alerts=False):
+        self.digests = digests
+        self.alerts = alerts
+
+    @abc.abstractmethod
+    def request(self, text) -> tuple[str, dict]:
+        """Return the url and the json payload posting ``text``."""
+
+
+class TelegramSink(Sink):
+    name = "telegram"
+
+    def __init__(self, token, chat_id, **kwargs):
+        super().__init__(**kwargs)
+        self.token = token
+        self.chat_id = chat_id
+
+    def request(self, text):
+        return f"https://api.telegram.org/bot{self.token}/sendMessage", {"chat_id": self.chat_id, "text": text}
+
+
+class DiscordSink(Sink):
+    name = "discord"
+
+    def __init__(self, webhook_url, **kwargs):
+        super().__init__(**kwargs)
+        self.webhook_url = webhook_url
+
+    def request(self, text):
+        return self.webhook_url, {"content": text[:2000]}
+
+
+class SlackSink(Sink):
+    name = "slack"
+
+    def __init__(self, webhook_url, channel, user_mentions=(), **kwargs):
+        super().__init__(**kwargs)
+        self.webhook_url = webhook_url
+        self.channel = channel
+        self.user_mentions = list(user_mentions)
+
+    def request(self, text):
+        mentions = " ".join(f"<@{_}>" for _ in self.user_mentions)
+        return self.webhook_url, {"channel": self.channel, "text": f"{text}\n{mentions}".strip()}
+
+
+class TeamsSink(Sink):
+    name = "teams"
+
+    def __init__(self, webhook_url, user_mentions=(), **kwargs):
+        super().__init__(**kwargs)
+        self.webhook_url = webhook_url
+        self.user_mentions = list(user_mentions)
+
+    def request(self, text):
+        mentions = " ".join(f"<at>{_}</at>" for _ in self.user_mentions)
+        return self.webhook_url, {"text": f"{text}\n{mentions}".strip().replace("\n", "  \n")}
+
+
+def sinks_from_constants() -> list[Sink]:
+    output = []
+    if (tg_token := constants.TELEGRAM_BOT_TOKEN) and (tg_chat := constants.TELEGRAM_CHAT_ID):
+        # the authorization url always goes to Telegram, digests only if announcing is on
+        output.append(TelegramSink(tg_token, tg_chat, digests=constants.TELEGRAM_ANNOUNCE == "True", alerts=True))
+
+    if discord_webhook := constants.DISCORD_WEBHOOK_URL:
+        output.append(DiscordSink(discord_webhook))
+
+    if (slack_webhook := constants.SLACK_WEBHOOK_URL) and (slack_channel := constants.SLACK_CHANNEL):
+        output.append(SlackSink(slack_webhook, slack_channel, constants.SLACK_USER_MENTIONS.split()))
+
+    if teams_webhook := constants.TEAMS_WEBHOOK_URL:
+        output.append(TeamsSink(teams_webhook, constants.TEAMS_USER_MENTIONS.split()))
+
+    return output
+
+
+class Notifier:
+    """
+    Non-blocking notification pipeline.
+
+    ``push`` only enqueues an event. A background worker aggregates events into one digest,
+    sent on ``flush`` (end of a run) or every ``interval`` seconds, over a pooled session with retries.
+    A slow or dead webhook only ever delays the worker, never the caller.
+    """
+
+    def __init__(self, sinks: list[Sink], title="Youtube Automanager", interval: float | None = None):
+        self.sinks = sinks
+        self.title = title
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(max_retries=RETRY, pool_connections=len(sinks) or 1)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._events: dict[str, list[str]] = defaultdict(list)
+        self._since: datetime = datetime.now(tz=pendulum.local_timezone())
+        self._flushed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        if self.sinks:
+            self._thread.start()
+
+    @property
+    def enabled(self):
+        return bool(self.sinks)
+
+    def push(self, kind, message):
+        if self.enabled:
+            self._queue.put_nowait((kind, message))
+
+    def alert(self, message):
+        """Send ``message`` right away to the alert sinks, bypassing the digest."""
+        if self.enabled:
+            self._queue.put_nowait((None, message))
+
+    def flush(self, wait: float | None = None):
+        """Send the digest of everything pushed so far. Optionally wait up to ``wait`` seconds for it to go out."""
+        if not self.enabled:
+            return
+
+        self._flushed.clear()
+        self._queue.put_nowait(_FLUSH)
+        if wait:
+            self._flushed.wait(wait)
+
+    def close(self, wait: float = HTTP_TIMEOUT):
+        if not self.enabled or not self._thread.is_alive():
+            return
+
+        self.flush()
+        self._queue.put_nowait(_STOP)
+        self._thread.join(wait)
+
+    def digest(self) -> str | None:
+        if not self._events:
+            return None
+
+        since = pendulum.instance(self._since).to_datetime_string()
+        lines = [f"{self.title} digest since {since}"]
+        for kind, title in SECTIONS.items():
+            if not (messages := self._events.get(kind)):
+                continue
+
+            lines.append(f"\n{title} ({len(messages)}):")
+            lines.extend(f"- {_}" for _ in messages[:MAX_SECTION_LINES])
+            if (more := len(messages) - MAX_SECTION_LINES) > 0:
+                lines.append(f"... and {more} more")
+        return "\n".join(lines)
+
+    def _send(self, text, alert=False):
+        for sink in self.sinks:
+            if not (sink.alerts if alert else sink.digests):
+                continue
+
+            url, payload = sink.request(text)
+            try:
+                response = self._session.post(url, json=payload, timeout=HTTP_TIMEOUT)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                LOG.exception(f"Failed to notify {sink.name}", exc_info=e)
+
+    def _send_digest(self):
+        if (text := self.digest()) is not None:
+            self._send(text)
+        self._events.clear()
+        self._since = datetime.now(tz=pendulum.local_timezone())
+
+    def _run(self):
+        deadline = time.monotonic() + self.interval if self.interval else None
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _FLUSH
+
+            if item is _STOP:
+                return
+
+            if item is _FLUSH:
+                self._send_digest()
+                self._flushed.set()
+                if self.interval:
+                    deadline = time.monotonic() + self.interval
+                continue
+
+            kind, message = item
+            if kind is None:
+                self._send(message, alert=True)
+            else:
+                self._events[kind].append(message)
@@ -8,7 +8,6 @@ import threading
 from copy import copy
 
 import pendulum
-import requests
 from pendulum import UTC
 from google_auth_oauthlib.flow import InstalledAppFlow
 from time import sleep
@@ -26,11 +25,15 @@ from global_logger import Log
 from worker import async_worker
 
 from youtube_automanager import constants
+from youtube_automanager.db import as_local
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
     from pathlib import Path
 
+    from youtube_automanager.notifications import Notifier
+
 LOG = Log.get_logger()
 LOCAL = pendulum.local_timezone()
 
@@ -70,6 +73,7 @@ class OAuth:
         port: int,
         redirect_uri: str,
         token_url: str,
+        notifier: Notifier | None = None,
     ):
         self.host = host
         self.port = port
@@ -77,8 +81,12 @@ class OAuth:
         self.client_secrets_file = client_secrets_file
         self.token_url = token_url
         self.redirect_uri = redirect_uri
+        self.notifier = notifier
         self.__flow: InstalledAppFlow | None = None
         self._web_server: uvicorn.Server | None = None
+        self._refresh_lock = threading.Lock()
+        # called with the new token dict after every refresh, from the refreshing thread
+        self.token_listeners: list[Callable[[dict], None]] = []
 
     @atexit_register
     def exit(self):
@@ -190,11 +198,8 @@ class OAuth:
 
         auth_url = self.generate_auth_url()
         LOG.yellow(auth_url)
-        if (tg_token := constants.TELEGRAM_BOT_TOKEN) and (tg_chat_id := constants.TELEGRAM_CHAT_ID):
-            message = f"Youtube Automanager Authorization URL:\n{auth_url}"
-            url = f"https://api.telegram.org/bot{tg_token}/sendMessage"
-            with contextlib.suppress(Exception):
-                requests.post(url, json={"chat_id": tg_chat_id, "text": message}, timeout=30)
+        if self.notifier is not None:
+            self.notifier.alert(f"Youtube Automanager Authorization URL:\n{auth_url}")
 
         _ = self.web_server
         while not self.authorized:
@@ -214,11 +219,44 @@ class OAuth:
     def client_secret(self):
         return self.client_config.get("client_secret")
 
-    def refresh_token_(self):
+    def _refresh_token(self):
         self.session.token = output = self.session.refresh_token(token_url=self.token_url)
         LOG.debug(f"Token refresh result:\n{pprint.pformat(output)}")
+        for listener in self.token_listeners:
+            listener(output)
         return output
 
+    def refresh_token_(self):
+        with self._refresh_lock:
+            return self._refresh_token()
+
+    def ensure_token(self):
+        """
+        Return an access token that is valid for a while, refreshing it ahead of expiry.
+
+        Concurrent callers share a single refresh: the first one refreshes, the rest wait for it and reuse its token.
+        """
+        if not self.token_expires():
+            return self.access_token
+
+        with self._refresh_lock:
+            if self.token_expires():
+                LOG.green("Refreshing token")
+                self._refresh_token()
+        return self.access_token
+
+    def set_token(self, refresh_token, access_token=None, expires_at: datetime | None = None):
+        token = {"refresh_token": refresh_token, "token_type": "Bearer"}
+        if access_token and expires_at is not None:
+            expires_at_ = pendulum.instance(as_local(expires_at))
+            token.update(
+                access_token=access_token,
+                expires_at=expires_at_.timestamp(),
+                expires_in=max(0, int((expires_at_ - pendulum.now(UTC)).total_seconds())),
+            )
+        with self._refresh_lock:
+            self.session.token = token
+
     @property
     def refresh_token(self):
         return self.session.token.get("refresh_token")
@@ -255,7 +293,7 @@ class OAuth:
             LOG.green("Refreshing token")
             refresh_token = copy(self.refresh_token)
             LOG.debug(f"Using refresh token {refresh_token}")
-            self.session.refresh_token(token_url=self.token_url)
+            self.refresh_token_()
             new_refresh_token = copy(self.refresh_token)
             LOG.debug(f"New refresh token: {new_refresh_token}")
             LOG.green(f"Refresh Token updated: {refresh_token != new_refresh_token}")
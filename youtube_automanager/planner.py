@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import math
+from collections import defaultdict
+
+from global_logger import Log
+
+from youtube_automanager.backfill import INSERT_COST, LIST_COST
+from youtube_automanager.db import BackfillItem, BackfillJob
+from youtube_automanager.youtube_api import PAGE_SIZE
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from youtube_automanager.config import Rule, YoutubeAutoManagerConfig
+    from youtube_automanager.db import DatabaseController, PlaylistSnapshot
+
+LOG = Log.get_logger()
+
+SUBSCRIPTIONS_LIST = "subscriptions.list"
+ACTIVITIES_LIST = "activities.list"
+PLAYLISTS_LIST = "playlists.list"
+PLAYLIST_ITEMS_LIST = "playlistItems.list"
+PLAYLIST_ITEMS_INSERT = "playlistItems.insert"
+ENDPOINT_COSTS = {
+    SUBSCRIPTIONS_LIST: LIST_COST,
+    ACTIVITIES_LIST: LIST_COST,
+    PLAYLISTS_LIST: LIST_COST,
+    PLAYLIST_ITEMS_LIST: LIST_COST,
+    PLAYLIST_ITEMS_INSERT: INSERT_COST,
+}
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def _pages(items) -> int:
+    return max(1, math.ceil((items or 0) / PAGE_SIZE))
+
+
+def _touched(expected: float) -> float:
+    # chance that at least one of a Poisson number of videos shows up in a run
+    return 1 - math.exp(-expected)
+
+
+class CapacityPlan:
+    """
+    Expected API usage of the configured rules, simulated from the database instead of the API.
+
+    Subscriptions are the channels the runs have seen, each with its observed upload rate, playlists come from
+    the last playlist snapshot. Videos of a run are treated as Poisson arrivals: a playlist is listed when at
+    least one video is expected to go to it, and every expected video is one insert.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        config: YoutubeAutoManagerConfig,
+        db: DatabaseController,
+        interval: float,
+        title_match_rate: float = 0.25,
+        default_upload_rate: float = 0.5,
+        accounts: int = 1,
+    ):
+        self.config = config
+        self.db = db
+        self.interval = interval
+        self.title_match_rate = title_match_rate
+        self.default_upload_rate = default_upload_rate
+        self.accounts = accounts
+        self.watermarks = db.watermarks()
+        self.playlists: dict[str, PlaylistSnapshot] = db.playlist_snapshots()
+        self.unknown_rates = 0
+        self.unknown_playlists: set[str] = set()
+        # expected videos per run going to each playlist
+        self.videos: dict[str, float] = defaultdict(float)
+        self.requests: dict[str, float] = dict.fromkeys(ENDPOINT_COSTS, 0.0)
+        self.simulate()
+
+    @property
+    def runs_per_day(self):
+        return SECONDS_PER_DAY / self.interval
+
+    def match_rate(self, rule: Rule, channel_id, channel_name) -> float:
+        if channel_id in rule.channel_ids or any(_.match(channel_name or "") for _ in rule.channel_names):
+            return 1.0
+
+        return self.title_match_rate if rule.video_title_patterns else 0.0
+
+    def playlist_key(self, rule: Rule) -> str:
+        if rule.playlist_id:
+            if rule.playlist_id not in self.playlists:
+                self.unknown_playlists.add(rule.playlist_id)
+            return rule.playlist_id
+
+        for playlist_id, snapshot in self.playlists.items():
+            if snapshot.title == rule.playlist_name:
+                return playlist_id
+
+        self.unknown_playlists.add(rule.playlist_name)
+        return rule.playlist_name
+
+    def playlist_pages(self, key) -> int:
+        snapshot = self.playlists.get(key)
+        return _pages(snapshot.item_count if snapshot is not None else None)
+
+    def simulate(self):
+        rules = self.config.rules
+        activity_pages = 0
+        for channel_id, watermark in self.watermarks.items():
+            rate = watermark.upload_rate
+            if rate is None:
+                self.unknown_rates += 1
+                rate = self.default_upload_rate
+            uploads = rate * self.interval / SECONDS_PER_DAY
+            activity_pages += _pages(uploads)
+            # several rules putting the channel into one playlist still insert each video once
+            shares: dict[str, float] = defaultdict(float)
+            for rule in rules.candidates(channel_id):
+                key = self.playlist_key(rule)
+                shares[key] = max(shares[key], self.match_rate(rule, channel_id, watermark.channel_name))
+            for key, share in shares.items():
+                self.videos[key] += uploads * share
+
+        subscriptions = len(self.watermarks)
+        expected = sum(self.videos.values())
+        self.requests[SUBSCRIPTIONS_LIST] = _pages(subscriptions)
+        self.requests[ACTIVITIES_LIST] = activity_pages
+        self.requests[PLAYLISTS_LIST] = _touched(expected) * _pages(len(self.playlists))
+        self.requests[PLAYLIST_ITEMS_LIST] = sum(
+            _touched(videos) * self.playlist_pages(key) for key, videos in self.videos.items()
+        )
+        self.requests[PLAYLIST_ITEMS_INSERT] = expected
+
+    def units_per_run(self) -> dict[str, float]:
+        return {endpoint: requests * ENDPOINT_COSTS[endpoint] for endpoint, requests in self.requests.items()}
+
+    def units_per_day(self) -> float:
+        return sum(self.units_per_run().values()) * self.runs_per_day * self.accounts
+
+    def backfill_units(self) -> tuple[int, int]:
+        """Quota units the known backfill work still needs, and the number of configured backfills not scanned yet."""
+        jobs = self.db.backfill_jobs()
+        units = 0
+        unscanned = 0
+        for backfill in self.config.backfills:
+            job = jobs.get(backfill.key)
+            if job is None or job.state == BackfillJob.SCANNING:
+                unscanned += 1
+            if job is not None and job.state != BackfillJob.DONE:
+                units += self.db.backfill_progress(job.job_id).get(BackfillItem.PENDING, 0) * INSERT_COST
+        return units, unscanned
+
+    def wall_time(self, concurrency: int, read_latency: float, insert_latency: float) -> tuple[float, float]:
+        """
+        Seconds a run spends on reads and on inserts.
+
+        Reads run one after another. Inserts overlap with them, one writer per playlist, ``concurrency`` at once.
+        """
+        reads = sum(v for k, v in self.requests.items() if k != PLAYLIST_ITEMS_INSERT) * read_latency
+        inserts = self.requests[PLAYLIST_ITEMS_INSERT]
+        busiest = max(self.videos.values(), default=0.0)
+        return reads, max(busiest, inserts / max(1, concurrency)) * insert_latency
+
+    def report(
+        self,
+        daily_quota: int,
+        backfill_share: float,
+        concurrency: int,
+        read_latency: float,
+        insert_latency: float,
+    ) -> bool:
+        """Log the plan and return whether it fits both the daily quota and the run interval."""
+        LOG.green(
+            f"Plan for {len(self.watermarks)} subscriptions, {len(self.config.rules)} rules, "
+            f"{len(self.playlists)} playlists, a run every {self.interval:.0f}s ({self.runs_per_day:.1f} runs/day), "
+            f"{self.accounts} account(s)",
+        )
+        if self.unknown_rates:
+            LOG.yellow(
+                f"{self.unknown_rates} channels have no upload rate yet, assuming {self.default_upload_rate}/day",
+            )
+        if self.unknown_playlists:
+            LOG.yellow(f"Playlists not in the snapshot, assuming one page each: {sorted(self.unknown_playlists)}")
+        LOG.green(f"Videos matching a title pattern only: assuming {self.title_match_rate:.0%}")
+
+        units_per_run = self.units_per_run()
+        LOG.green(f"{'endpoint':<22}{'requests/run':>14}{'units/run':>12}{'units/day':>12}")
+        for endpoint, requests in self.requests.items():
+            units_day = units_per_run[endpoint] * self.runs_per_day * self.accounts
+            LOG.green(f"{endpoint:<22}{requests:>14.2f}{units_per_run[endpoint]:>12.2f}{units_day:>12.0f}")
+        inserts = self.requests[PLAYLIST_ITEMS_INSERT]
+        LOG.green(
+            f"Inserts: {inserts:.2f}/run, {inserts * self.runs_per_day * self.accounts:.0f}/day "
+            f"into {sum(1 for _ in self.videos.values() if _)} playlists",
+        )
+
+        backfill_limit = int(daily_quota * backfill_share)
+        backfill_units, unscanned = self.backfill_units()
+        backfill_day = min(backfill_limit, backfill_units)
+        if self.config.backfills:
+            days = math.ceil(backfill_units / backfill_limit) if backfill_limit else math.inf
+            LOG.green(
+                f"Backfills: {backfill_units} units of known work left at {backfill_limit} units/day, ~{days} days"
+                + (f", {unscanned} still scanning" if unscanned else ""),
+            )
+
+        used = self.units_per_day() + backfill_day
+        quota_ok = used <= daily_quota
+        reads, insert_time = self.wall_time(concurrency, read_latency, insert_latency)
+        wall = max(reads, insert_time)
+        backfill_time = backfill_day / INSERT_COST * insert_latency
+        time_ok = wall + backfill_time <= self.interval
+        LOG.green(
+            f"Quota: {used:.0f}/{daily_quota} units/day ({used / daily_quota:.0%})"
+            + ("" if quota_ok else " - EXCEEDS THE DAILY QUOTA"),
+        )
+        LOG.green(
+            f"Wall time per run: {reads:.1f}s of reads, {insert_time:.1f}s of inserts at concurrency {concurrency} "
+            f"-> ~{wall:.1f}s, +{backfill_time:.1f}s for backfills on the first run of the quota day"
+            + ("" if time_ok else " - OVERRUNS THE INTERVAL"),
+        )
+        return quota_ok and time_ok
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import pendulum
+from global_logger import Log
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from types import CodeType, FrameType
+
+LOG = Log.get_logger()
+
+AUTHORIZE = "authorize"
+SUBSCRIPTIONS = "subscriptions"
+ACTIVITY_FETCH = "activity_fetch"
+MATCHING = "matching"
+PLAYLIST_SYNC = "playlist_sync"
+INSERTS = "inserts"
+MAX_DEPTH = 128
+TOP_FUNCTIONS = 40
+_DISABLED = nullcontext()
+
+
+class PhaseStats:
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.samples = 0
+
+
+class Profiler:
+    """
+    Low overhead sampling profiler split by run phase.
+
+    Code is tagged with ``phase`` per thread. A daemon thread samples the stacks of every thread that is inside
+    a phase each ``interval`` seconds, so insert workers are profiled too and the profiled code is never
+    instrumented. ``dump`` writes a report per phase and one collapsed-stack file for flamegraph tools
+    into ``output_dir``. Without an ``output_dir`` the profiler is disabled and ``phase`` costs next to nothing.
+    """
+
+    def __init__(self, output_dir: str | Path | None = None, interval: float = 0.01):
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+        self.interval = interval
+        self.stats: dict[str, PhaseStats] = defaultdict(PhaseStats)
+        self._stacks: Counter[tuple[str, tuple[CodeType, ...]]] = Counter()
+        self._phases: dict[int, str] = {}
+        self._labels: dict[CodeType, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self):
+        return self.output_dir is not None
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        LOG.green(f"Profiling every {self.interval * 1000:.0f}ms into {self.output_dir}")
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def phase(self, name):
+        """Context manager tagging the current thread with phase ``name``. Nested phases win until they exit."""
+        if not self.enabled:
+            return _DISABLED
+
+        return self._phase(name)
+
+    @contextmanager
+    def _phase(self, name):
+        ident = threading.get_ident()
+        previous = self._phases.get(ident)
+        self._phases[ident] = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if previous is None:
+                self._phases.pop(ident, None)
+            else:
+                self._phases[ident] = previous
+            with self._lock:
+                stats = self.stats[name]
+                stats.calls += 1
+                stats.wall += elapsed
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()  # noqa: SLF001
+            for ident, phase in list(self._phases.items()):
+                if ident == own or (frame := frames.get(ident)) is None:
+                    continue
+
+                self._stacks[phase, self._stack(frame)] += 1
+            del frames
+
+    @staticmethod
+    def _stack(frame: FrameType | None) -> tuple[CodeType, ...]:
+        codes = []
+        while frame is not None and len(codes) < MAX_DEPTH:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        return tuple(codes)
+
+    def _label(self, code: CodeType):
+        if (label := self._labels.get(code)) is None:
+            label = f"{Path(code.co_filename).stem}:{code.co_qualname}:{code.co_firstlineno}"
+            self._labels[code] = label
+        return label
+
+    def _report(self, phase, stacks: dict[tuple[CodeType, ...], int]) -> str:
+        stats = self.stats[phase]
+        total = sum(stacks.values())
+        own: Counter[str] = Counter()
+        inclusive: Counter[str] = Counter()
+        for codes, count in stacks.items():
+            labels = [self._label(_) for _ in codes]
+            own[labels[-1]] += count
+            for label in set(labels):
+                inclusive[label] += count
+
+        lines = [
+            f"phase {phase}: {stats.calls} calls, {stats.wall:.3f}s wall, {total} samples every {self.interval}s",
+            "",
+            "own samples:",
+        ]
+        lines.extend(f"{count:8d} {count / total:7.1%}  {label}" for label, count in own.most_common(TOP_FUNCTIONS))
+        lines.extend(("", "inclusive samples:"))
+        lines.extend(
+            f"{count:8d} {count / total:7.1%}  {label}" for label, count in inclusive.most_common(TOP_FUNCTIONS)
+        )
+        return "\n".join(lines) + "\n"
+
+    def dump(self) -> Path | None:
+        """Write the profiles collected so far, overwriting the previous dump of this run."""
+        if not self.enabled:
+            return None
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stacks = dict(self._stacks)
+        by_phase: dict[str, dict[tuple[CodeType, ...], int]] = defaultdict(dict)
+        for (phase, codes), count in stacks.items():
+            by_phase[phase][codes] = count
+        for phase, phase_stacks in by_phase.items():
+            self.stats[phase].samples = sum(phase_stacks.values())
+            (self.output_dir / f"{phase}.txt").write_text(self._report(phase, phase_stacks), encoding="utf-8")
+
+        collapsed = self.output_dir / "profile.collapsed"
+        with collapsed.open("w", encoding="utf-8") as f:
+            for (phase, codes), count in sorted(stacks.items(), key=lambda _: -_[1]):
+                f.write(f"{';'.join([phase, *(self._label(_) for _ in codes)])} {count}\n")
+
+        summary = ", ".join(f"{phase} {stats.wall:.1f}s/{stats.calls}" for phase, stats in sorted(self.stats.items()))
+        LOG.green(f"Profile written to {self.output_dir}: {summary}")
+        return self.output_dir
+
+
+def profile_dir(base: Path) -> Path:
+    return base / f"profile_{pendulum.now().format('YYYYMMDD_HHmmss')}"
@@ -1,20 +1,41 @@
 #!/usr/bin/env python3
-import re
+import queue
+import signal
+import time
 from datetime import datetime
 
 import pendulum
 from global_logger import Log
 from pyyoutube import Api, Activity
-from knockknock import telegram_sender, discord_sender, slack_sender, teams_sender
 
 from youtube_automanager import constants
-from youtube_automanager.config import YoutubeAutoManagerConfig
-from youtube_automanager.db import DatabaseController
+from youtube_automanager.backfill import Backfiller, QuotaBudget
+from youtube_automanager.cassette import Cassette, RECORD, REDACTED
+from youtube_automanager.config import RuleSet, YoutubeAutoManagerConfig
+from youtube_automanager.db import ChannelWatermark, DatabaseController, PlaylistLedger
+from youtube_automanager.inserts import InsertCancelledError, InsertExecutor, InsertTask
+from youtube_automanager.notifications import ERROR, INFO, Notifier, QUOTA_WARNING, sinks_from_constants, VIDEO_ADDED
 from youtube_automanager.oauth import OAuth
-from youtube_automanager.youtube_api import YoutubeAPI
+from youtube_automanager.profiling import (
+    ACTIVITY_FETCH,
+    AUTHORIZE,
+    INSERTS,
+    MATCHING,
+    PLAYLIST_SYNC,
+    profile_dir,
+    Profiler,
+    SUBSCRIPTIONS,
+)
+from youtube_automanager.websub import FeedEntry, WebSubServer, WebSubSubscriber
+from youtube_automanager.youtube_api import transient_error, YoutubeAPI
 import sys
 
 LOG = Log.get_logger()
+LOCAL = pendulum.local_timezone()
+# a channel upload rate follows what was observed over about this many days
+UPLOAD_RATE_HORIZON_DAYS = 7
+# seconds the inserts already running get to finish when the manager is stopped
+STOP_TIMEOUT = 30
 
 
 def token_expired(dt: datetime):
@@ -22,12 +43,30 @@ def token_expired(dt: datetime):
 
 
 class YoutubeAutoManager:
-    def __init__(self, oauth: OAuth, db: DatabaseController, config: YoutubeAutoManagerConfig):
-        self.oauth: OAuth = oauth
+    def __init__(  # noqa: PLR0913
+        self,
+        oauth: OAuth | None,
+        db: DatabaseController,
+        config: YoutubeAutoManagerConfig,
+        cassette: Cassette | None = None,
+        notifier: Notifier | None = None,
+        profiler: Profiler | None = None,
+    ):
+        self.oauth: OAuth | None = oauth
         self.db: DatabaseController = db
         self.config: YoutubeAutoManagerConfig = config
+        self.cassette: Cassette | None = cassette
+        self.notifier: Notifier = notifier or Notifier([])
+        self.profiler: Profiler = profiler or Profiler()
         self._yt_api = None
         self._start_date = None
+        self.inserts = InsertExecutor(self._insert, max_workers=constants.INSERT_WORKERS)
+        # channel watermarks wait for the channel's queued inserts before they advance
+        self._deferred_watermarks: dict[str, dict] = {}
+        self._failed_channels: set[str] = set()
+        self._playlists_saved = False
+        if oauth is not None:
+            oauth.token_listeners.append(self._on_token_refresh)
 
     def check_config(self):
         config = self.config
@@ -40,26 +79,48 @@ class YoutubeAutoManager:
         return True
 
     def save_token(self):
-        saved_refresh_token = self.db.config.refresh_token
-        new_refresh_token = self.oauth.refresh_token
-        if saved_refresh_token == new_refresh_token:
+        if self.oauth is None:
+            return
+
+        config = self.db.config
+        new_refresh_token = self.oauth.refresh_token or config.refresh_token
+        new_access_token = self.oauth.access_token
+        new_expires_at = self.oauth.token_expires_at
+        if new_expires_at is not None:
+            new_expires_at = pendulum.instance(new_expires_at).in_tz(LOCAL).naive()
+        if (config.refresh_token, config.access_token, config.token_expires_at) == (
+            new_refresh_token,
+            new_access_token,
+            new_expires_at,
+        ):
             return
 
-        LOG.debug(f"Saving new refresh token {new_refresh_token}")
-        self.db.config.refresh_token = new_refresh_token
+        if config.refresh_token != new_refresh_token:
+            LOG.debug(f"Saving new refresh token {new_refresh_token}")
+        config.refresh_token = new_refresh_token
+        config.access_token = new_access_token
+        config.token_expires_at = new_expires_at
         self.db.save_config()
         self.db.commit()
 
+    def _on_token_refresh(self, token: dict):
+        # may run on any thread: only hand the token to the API clients, it is persisted by save_token
+        if self._yt_api is not None:
+            self._yt_api.set_access_token(token.get("access_token"))
+
     def authorize(self):
-        refresh_token = self.db.config.refresh_token
+        config = self.db.config
+        refresh_token = config.refresh_token
         if refresh_token:
-            self.oauth.session.token["refresh_token"] = refresh_token
+            self.oauth.set_token(refresh_token, access_token=config.access_token, expires_at=config.token_expires_at)
             LOG.debug(f"Got saved refresh token: {refresh_token}")
-        if refresh_token and self.oauth.refresh_token_():
+        if refresh_token and not self.oauth.token_expires():
+            LOG.green("Authorized using the saved access token.")
+        elif refresh_token and self.oauth.refresh_token_():
             LOG.green("Authorized using the saved refresh token.")
         else:
             self.oauth.authorize()
-            self.save_token()
+        self.save_token()
 
         # oauth.run_token_refreshing_daemon()  # TODO:  # noqa: ERA001
         LOG.green("Authorization complete")
@@ -90,80 +151,55 @@ class YoutubeAutoManager:
         self.db.save_config()
         self.db.commit()
 
-    def parse_activity(self, activity: Activity, start_date: datetime):  # noqa: C901, PLR0912, PLR0915
-        video_id = activity.contentDetails.upload.videoId
-        video_channel_id = activity.snippet.channelId
-        video_channel_name = activity.snippet.channelTitle
-        video_title = activity.snippet.title
-        video_date = pendulum.instance(datetime.fromisoformat(activity.snippet.publishedAt))
+    def parse_activity(
+        self,
+        activity: Activity,
+        start_date: datetime,
+        rules: RuleSet | None = None,
+    ) -> list[InsertTask]:
+        return self.process_video(
+            video_id=activity.contentDetails.upload.videoId,
+            video_channel_id=activity.snippet.channelId,
+            video_channel_name=activity.snippet.channelTitle,
+            video_title=activity.snippet.title,
+            published_at=activity.snippet.publishedAt,
+            start_date=start_date,
+            rules=rules,
+        )
+
+    def process_video(  # noqa: PLR0913
+        self,
+        *,
+        video_id,
+        video_channel_id,
+        video_channel_name,
+        video_title,
+        published_at: str,
+        start_date: datetime,
+        rules: RuleSet | None = None,
+    ) -> list[InsertTask]:
+        """Match a video against the rules and return the inserts it needs, for the caller to submit together."""
+        video_date = pendulum.instance(datetime.fromisoformat(published_at)).in_tz(LOCAL)
         LOG.debug(f"Working on {video_channel_name} : {video_title}")
 
         if video_date < pendulum.instance(start_date):
             LOG.debug(f"Video {video_id} '{video_title}' is too old")
-            return
-
-        rules = self.config.config.get("rules", [])
-        for rule in rules:  # TODO: video duration filter
-            match = False
-
-            rule_channel_id = rule.get("channel_id")
-            if rule_channel_id and not isinstance(rule_channel_id, list):
-                rule_channel_id = [rule_channel_id]
-
-            if rule_channel_id and any(_ for _ in rule_channel_id if _ == video_channel_id):
-                LOG.debug(
-                    f"Video {video_id} '{video_title}' channel id matches rule: {video_channel_id}",
-                )
-                match = True
-            else:
-                LOG.debug(
-                    f"Video {video_id} '{video_title}' doesn't match any of the rule channel ids: {rule_channel_id}",
-                )
-
-            rule_channel_name = rule.get("channel_name")
-            if rule_channel_name and not isinstance(rule_channel_name, list):
-                rule_channel_name = [rule_channel_name]
-            if rule_channel_name and any(_ for _ in rule_channel_name if re.match(_, video_channel_name)):
-                LOG.debug(f"Video {video_id} '{video_title}' matches rule channel name: {video_channel_name}")
-                match = True
-            else:
-                LOG.debug(
-                    f"Video {video_id} '{video_title}' doesn't match any of the rule channel names: "
-                    f"{rule_channel_name}",
-                )
-
-            rule_video_title_pattern = rule.get("video_title_pattern")
-            if rule_video_title_pattern and not isinstance(rule_video_title_pattern, list):
-                rule_video_title_pattern = [rule_video_title_pattern]
-            if rule_video_title_pattern and any(
-                _
-                for _ in rule_video_title_pattern
-                if re.match(_, video_title, flags=re.IGNORECASE) or re.search(_, video_title, flags=re.IGNORECASE)
-            ):
-                LOG.debug(
-                    f"Video {video_id} '{video_title}' match es rule pattern {rule_video_title_pattern}",
-                )
-                match = True
-            else:
-                LOG.debug(
-                    f"Video {video_id} '{video_title}' title does not match any of the patterns "
-                    f"{rule_video_title_pattern}",
-                )
-
-            if not match:
-                continue
-
-            rule_playlist_id = rule.get("playlist_id")
-            rule_playlist_name = rule.get("playlist_name")
-            if rule_playlist_id:
-                playlist = self.yt_api.get_playlist_by_id(playlist_id=rule_playlist_id)
-            elif rule_playlist_name:
-                playlists = self.yt_api.get_playlists()
-                playlist = next((p for p in playlists if p.snippet.localized.title == rule_playlist_name), None)
-            else:
+            return []
+
+        rules = rules if rules is not None else self.config.rules
+        matched = rules.match(video_id, video_channel_id, video_channel_name, video_title)
+        tasks = []
+        for rule_ in matched:  # TODO: video duration filter
+            rule = rule_.raw
+            rule_playlist_id = rule_.playlist_id
+            rule_playlist_name = rule_.playlist_name
+            if not rule_playlist_id and not rule_playlist_name:
                 LOG.error(f"Rule has no playlist_id or playlist_name:\n{rule}")
                 continue
 
+            with self.profiler.phase(PLAYLIST_SYNC):
+                playlist = self.find_playlist(rule_playlist_id, rule_playlist_name)
+
             if not playlist:
                 LOG.error(f"Failed to find playlist for rule:\n{rule}")
                 continue
@@ -174,74 +210,385 @@ class YoutubeAutoManager:
                 f"Video {video_id} '{video_title}' matches rule:\n{rule}\n"
                 f"Adding it to playlist {playlist_id} '{playlist_title}'",
             )
-            if self.yt_api.video_in_playlist(video_id=video_id, playlist_id=playlist_id):
+            ledger = self.db.ledger(playlist_id, video_id)
+            if ledger is not None and ledger.state == PlaylistLedger.FAILED:
+                LOG.debug(
+                    f"Video {video_id} '{video_title}' can not be added to playlist {playlist_id}: {ledger.error}",
+                )
+                continue
+
+            with self.profiler.phase(PLAYLIST_SYNC):
+                in_playlist = ledger is not None or self.yt_api.video_in_playlist(
+                    video_id=video_id,
+                    playlist_id=playlist_id,
+                )
+            if in_playlist:
                 LOG.green(f"Video {video_id} '{video_title}' already in playlist {playlist_id} '{playlist_title}'")
                 continue
 
-            LOG.green(f"Adding video {video_id} '{video_title}' to playlist {playlist_id} '{playlist_title}'")
-            self.yt_api.add_video_to_playlist(video_id, playlist_id)
+            tasks.append(
+                InsertTask(
+                    video_id=video_id,
+                    video_title=video_title,
+                    playlist_id=playlist_id,
+                    playlist_title=playlist_title,
+                    channel_id=video_channel_id,
+                    channel_name=video_channel_name,
+                    published_at=video_date,
+                ),
+            )
+        return tasks
+
+    def find_playlist(self, playlist_id, playlist_name):
+        playlists = self.yt_api.get_playlists()
+        if not self._playlists_saved:
+            # kept for the capacity planner
+            self.db.save_playlist_snapshots(
+                (p.id, p.snippet.localized.title, p.contentDetails.itemCount if p.contentDetails else None)
+                for p in playlists
+            )
+            self._playlists_saved = True
+        if playlist_id:
+            return next((p for p in playlists if p.id == playlist_id), None)
+
+        return next((p for p in playlists if p.snippet.localized.title == playlist_name), None)
+
+    @staticmethod
+    def upload_rate(activities: int, start_date: datetime, end_date: datetime, watermark: ChannelWatermark | None):
+        """Estimate the uploads per day of a channel, moving its previous rate towards the one observed now."""
+        days = (pendulum.instance(end_date) - pendulum.instance(start_date, tz=LOCAL)).total_seconds() / 86400
+        if days <= 0:
+            return None
+
+        observed = activities / days
+        if watermark is None or watermark.upload_rate is None:
+            return observed
+
+        weight = min(1.0, days / UPLOAD_RATE_HORIZON_DAYS)
+        return watermark.upload_rate + weight * (observed - watermark.upload_rate)
+
+    def _insert(self, task: InsertTask):
+        # runs on an insert worker thread: no database access here
+        LOG.green(
+            f"Adding video {task.video_id} '{task.video_title}' to playlist {task.playlist_id} '{task.playlist_title}'",
+        )
+        with self.profiler.phase(INSERTS):
+            self.yt_api.add_video_to_playlist(task.video_id, task.playlist_id)
+
+    def collect_inserts(self):
+        """Record finished inserts and advance the watermarks of the channels whose inserts are all done."""
+        completed = self.inserts.completed()
+        if not completed and not self._deferred_watermarks:
+            return
+
+        with self.db.unit_of_work():
+            for task, error in completed:
+                if isinstance(error, InsertCancelledError):
+                    self._failed_channels.add(task.channel_id)
+                    continue
+
+                if error is not None and transient_error(error):
+                    LOG.error(f"Failed to add video {task.video_id} to playlist {task.playlist_id}", exc_info=error)
+                    self.report_error(error)
+                    self._failed_channels.add(task.channel_id)
+                    continue
+
+                if error is not None:
+                    # retrying cannot help: record the video as failed so it is not tried again
+                    LOG.error(
+                        f"Video {task.video_id} can not be added to playlist {task.playlist_id}, skipping it",
+                        exc_info=error,
+                    )
+                    self.report_error(error)
+                    self.db.add_ledger(
+                        task.playlist_id,
+                        task.video_id,
+                        channel_id=task.channel_id,
+                        published_at=task.published_at,
+                        state=PlaylistLedger.FAILED,
+                        error=str(error),
+                    )
+                    continue
+
+                self.db.add_ledger(
+                    task.playlist_id,
+                    task.video_id,
+                    channel_id=task.channel_id,
+                    published_at=task.published_at,
+                )
+                self.notifier.push(VIDEO_ADDED, f"{task.channel_name}: {task.video_title} -> {task.playlist_title}")
+
+            for channel_id in list(self._deferred_watermarks):
+                if self.inserts.pending(channel_id):
+                    continue
+
+                watermark = self._deferred_watermarks.pop(channel_id)
+                if channel_id in self._failed_channels:
+                    # keep the window open, the videos that failed transiently are retried by the next run
+                    LOG.yellow(f"Some videos of channel {channel_id} failed to be added, keeping its watermark")
+                    watermark = dict(checked_at=watermark["retry_from"], channel_name=watermark["channel_name"])
+                watermark.pop("retry_from", None)
+                self.db.advance_watermark(channel_id, **watermark)
+
+    def wait_inserts(self, stopping=False):
+        """
+        Wait for the queued inserts and record them.
+
+        When stopping, or when a stop interrupts the wait, the queued ones are dropped instead
+        and the finished ones are still recorded.
+        """
+        try:
+            if not stopping:
+                LOG.debug("Waiting for the queued inserts")
+                self.inserts.join()
+        except (KeyboardInterrupt, SystemExit):
+            stopping = True
+            raise
+        finally:
+            if stopping:
+                # the dropped inserts keep their channel watermarks behind, the next run retries them
+                self.inserts.shutdown(timeout=STOP_TIMEOUT)
+            self.collect_inserts()
+            self.inserts.log_stats()
+
+    def channel_start_date(self, start_date: datetime, watermark: ChannelWatermark | None) -> datetime:
+        if watermark is None:
+            return start_date
+
+        # the channel watermark wins over the global last update, it is kept behind when inserts failed
+        checked_at = pendulum.instance(watermark.checked_at, tz=LOCAL)
+        cfg_date = self.config.start_date
+        return cfg_date if cfg_date and cfg_date > checked_at else checked_at
 
     def parse(self):
         LOG.green("Parsing")
         start_date = self.start_date
         start_date_str = pendulum.instance(start_date).to_iso8601_string()
-        subscriptions = self.yt_api.get_subscriptions()
+        with self.profiler.phase(SUBSCRIPTIONS):
+            subscriptions = self.yt_api.get_subscriptions()
         total_subs = len(subscriptions)
         LOG.green(f"Got {total_subs} subscriptions")
         after_date = datetime.now(tz=pendulum.local_timezone())
         after_date_str = pendulum.instance(after_date).to_iso8601_string()
+        if self.cassette is not None and self.cassette.recording:
+            self.cassette.meta.update(start_date=start_date_str, subscriptions=total_subs)
+        watermarks = self.db.watermarks()
 
         LOG.green(f"Processing videos from {total_subs} subscriptions")
-        for i, subscription in enumerate(subscriptions, start=1):
-            LOG.debug(f"Parsing subscription {i}")
-            channel_id = subscription.snippet.resourceId.channelId
-            channel_name = subscription.snippet.title
-            activities = self.yt_api.get_channel_activities(
-                channel_id=channel_id,
-                after=start_date_str,
-                before=after_date_str,
-            )
-            activities = [a for a in activities.items if a.snippet.type == "upload"]
-            if not activities:
-                LOG.debug(f"{i}/{total_subs} No videos found for channel {channel_id} '{channel_name}'")
-                continue
-
-            LOG.green(f"{i}/{total_subs} Processing {len(activities)} videos for {channel_name}")
-            for _j, activity in enumerate(activities, start=1):
-                LOG.debug(f"Processing video {_j}/{len(activities)}")
-                self.parse_activity(activity=activity, start_date=start_date)
+        self._failed_channels.clear()
+        self._playlists_saved = False
+        stopping = False
+        try:
+            for i, subscription in enumerate(subscriptions, start=1):
+                LOG.debug(f"Parsing subscription {i}")
+                self.config.reload_if_changed()
+                rules = self.config.rules
+                channel_id = subscription.snippet.resourceId.channelId
+                channel_name = subscription.snippet.title
+                channel_start_date = self.channel_start_date(start_date, watermarks.get(channel_id))
+                with self.profiler.phase(ACTIVITY_FETCH):
+                    activities = self.yt_api.get_channel_activities(
+                        channel_id=channel_id,
+                        after=pendulum.instance(channel_start_date).to_iso8601_string(),
+                        before=after_date_str,
+                    )
+                activities = [a for a in activities.items if a.snippet.type == "upload"]
+                with self.db.unit_of_work(), self.profiler.phase(MATCHING):
+                    if not activities:
+                        LOG.debug(f"{i}/{total_subs} No videos found for channel {channel_id} '{channel_name}'")
+                    else:
+                        LOG.green(f"{i}/{total_subs} Processing {len(activities)} videos for {channel_name}")
+                    # activities come newest first: hand the inserts over together, they are written oldest first
+                    tasks = []
+                    for _j, activity in enumerate(activities, start=1):
+                        LOG.debug(f"Processing video {_j}/{len(activities)}")
+                        tasks.extend(self.parse_activity(activity=activity, start_date=channel_start_date, rules=rules))
+                    if queued := self.inserts.submit_many(tasks):
+                        LOG.debug(f"Queued {queued} videos of {channel_name}")
+
+                    last = max(activities, key=lambda _: _.snippet.publishedAt, default=None)
+                    self._deferred_watermarks[channel_id] = dict(
+                        checked_at=after_date,
+                        channel_name=channel_name,
+                        last_published_at=pendulum.parse(last.snippet.publishedAt).in_tz(LOCAL) if last else None,
+                        last_video_id=last.contentDetails.upload.videoId if last else None,
+                        upload_rate=self.upload_rate(
+                            len(activities),
+                            channel_start_date,
+                            after_date,
+                            watermarks.get(channel_id),
+                        ),
+                        retry_from=channel_start_date,
+                    )
+                    self.collect_inserts()
+                    self.save_token()
+        except (KeyboardInterrupt, SystemExit):
+            stopping = True
+            raise
+        finally:
+            self.wait_inserts(stopping=stopping)
 
         LOG.debug(f"Done parsing {total_subs} subscriptions")
         self.start_date = after_date
 
+    def backfill(self):
+        """Advance the configured backfills within their share of the daily quota."""
+        if not self.config.backfills:
+            return
+
+        budget = QuotaBudget(self.db, daily_quota=constants.DAILY_QUOTA, share=constants.BACKFILL_QUOTA_SHARE)
+        Backfiller(self, budget).run(self.config.backfills)
+
+    def process_notifications(self, notifications: queue.Queue[FeedEntry], timeout: float):
+        """Process videos pushed by the WebSub hub as they arrive, for ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                entry = notifications.get(timeout=min(remaining, 1))
+            except queue.Empty:
+                self.collect_inserts()
+                continue
+
+            # one failing notification must not stop the server, the next polling run catches the video anyway
+            try:
+                self.config.reload_if_changed()
+                with self.db.unit_of_work(), self.profiler.phase(MATCHING):
+                    tasks = self.process_video(
+                        video_id=entry.video_id,
+                        video_channel_id=entry.channel_id,
+                        video_channel_name=entry.channel_name,
+                        video_title=entry.title,
+                        published_at=entry.published_at,
+                        start_date=self.start_date,
+                    )
+                    self.inserts.submit_many(tasks)
+                    self.collect_inserts()
+                    self.save_token()
+            except Exception as e:
+                LOG.exception(f"Failed to process notification {entry}", exc_info=e)
+                self.report_error(e)
+
+    def serve(self):
+        """
+        Push ingestion: process WebSub notifications as they arrive.
+
+        Every ``WEBSUB_RECONCILE_INTERVAL`` a regular polling run catches anything the hub missed,
+        and the hub subscriptions are synced with the current YouTube subscriptions.
+        """
+        self.profiler.start()
+        with self.profiler.phase(AUTHORIZE):
+            self.authorize()
+        server = WebSubServer(
+            db_filepath=self.db.db_filepath,
+            username=self.db.username,
+            callback_url=constants.WEBSUB_CALLBACK_URL,
+            host=constants.WEBSUB_HOST,
+            port=constants.WEBSUB_PORT,
+        )
+        subscriber = WebSubSubscriber(
+            db=self.db,
+            hub_url=constants.WEBSUB_HUB_URL,
+            callback_url=constants.WEBSUB_CALLBACK_URL,
+            lease_seconds=constants.WEBSUB_LEASE_SECONDS,
+        )
+        server.start()
+        try:
+            while True:
+                # a long-running server must see subscriptions and playlists changed since the last cycle
+                self.yt_api.reset()
+                try:
+                    self.parse()
+                    self.backfill()
+                    subscriber.sync(_.snippet.resourceId.channelId for _ in self.yt_api.get_subscriptions())
+                except Exception as e:
+                    LOG.exception("an error occured", exc_info=e)
+                    self.report_error(e)
+                self.profiler.dump()
+                self.process_notifications(server.queue, timeout=constants.WEBSUB_RECONCILE_INTERVAL)
+                if not self.notifier.interval:
+                    self.notifier.flush()
+        finally:
+            self.inserts.shutdown(timeout=STOP_TIMEOUT)
+            server.stop()
+            self.profiler.stop()
+            self.profiler.dump()
+
+    def report_error(self, e: Exception):
+        kind = QUOTA_WARNING if "quota" in str(e).lower() else ERROR
+        self.notifier.push(kind, f"{type(e).__name__}: {e}")
+
     def start(self):
-        self.authorize()
+        self.profiler.start()
+        with self.profiler.phase(AUTHORIZE):
+            self.authorize()
+        started = time.monotonic()
         try:
             self.parse()
+            self.backfill()
         except Exception as e:
             LOG.exception("an error occured", exc_info=e)
+            self.report_error(e)
+        finally:
+            self.inserts.shutdown(timeout=STOP_TIMEOUT)
+            if self.cassette is not None and self.cassette.recording:
+                self.cassette.save()
+            if self._yt_api is not None:
+                self._yt_api.log_stats()
+            self.profiler.stop()
+            self.profiler.dump()
+            self.notifier.push(INFO, f"Run finished in {time.monotonic() - started:.0f}s")
+            self.notifier.flush()
+
+    @property
+    def access_token(self):
+        if self.oauth is None:  # offline cassette replay
+            return REDACTED
+
+        return self.oauth.ensure_token()
 
     @property
     def api(self):
+        if self.oauth is None:
+            return Api(access_token=self.access_token)
+
         return Api(
             client_id=self.oauth.client_id,
             client_secret=self.oauth.client_secret,
-            access_token=self.oauth.access_token,
+            access_token=self.access_token,
         )
 
     @property
     def yt_api(self):
         if self._yt_api is None:
-            self._yt_api = YoutubeAPI(self.api, self.oauth.access_token)
-        self._yt_api.access_token = self.oauth.access_token
+            self._yt_api = YoutubeAPI(
+                self.api,
+                self.access_token,
+                cassette=self.cassette,
+                token_provider=self.oauth.ensure_token if self.oauth is not None else None,
+            )
         return self._yt_api
 
 
+def _terminate(signum, _frame):
+    # unwind through the open unit of work instead of dying mid-transaction; finished channels are already saved
+    LOG.yellow(f"Got signal {signum}, stopping")
+    sys.exit(128 + signum)
+
+
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, _terminate)
     config_ = YoutubeAutoManagerConfig(config_filepath=constants.CONFIG_FILEPATH)
     if not config_.ok:
         sys.exit(1)
+    if constants.WEBSUB and not constants.WEBSUB_CALLBACK_URL:
+        LOG.error("WEBSUB=True needs WEBSUB_CALLBACK_URL, the url the hub reaches this container at")
+        sys.exit(1)
+    if constants.WEBSUB and constants.CASSETTE_RECORD:
+        # a cassette records one run, the server never ends and would keep every response in memory
+        LOG.error("CASSETTE_RECORD=True records a single run and can not be used with WEBSUB=True")
+        sys.exit(1)
 
+    notifier_ = Notifier(sinks_from_constants(), interval=constants.NOTIFY_INTERVAL)
     oauth_ = OAuth(
         client_secrets_file=constants.SECRETS_FILE,
         scopes=constants.SCOPES,
@@ -249,35 +596,32 @@ if __name__ == "__main__":
         port=constants.PORT,
         redirect_uri=constants.REDIRECT_URI,
         token_url=constants.TOKEN_URL,
+        notifier=notifier_,
     )
     db_ = DatabaseController(
         db_filepath=constants.DB_FILEPATH,
         username=constants.USERNAME,
     )
 
-    manager = YoutubeAutoManager(oauth=oauth_, db=db_, config=config_)
-
-    fnc = manager.start  # https://github.com/huggingface/knockknock
-    if (
-        constants.TELEGRAM_ANNOUNCE == "True"
-        and (tg_token := constants.TELEGRAM_BOT_TOKEN)
-        and (tg_chat := constants.TELEGRAM_CHAT_ID)
-    ):
-        # noinspection PyUnboundLocalVariable
-        fnc = telegram_sender(token=tg_token, chat_id=int(tg_chat))(fnc)
-
-    if discord_webhook := constants.DISCORD_WEBHOOK_URL:
-        fnc = discord_sender(discord_webhook)(fnc)
-
-    if (slack_webhook := constants.SLACK_WEBHOOK_URL) and (slack_channel := constants.SLACK_CHANNEL):
-        if slack_user_mentions := constants.SLACK_USER_MENTIONS:
-            slack_user_mentions = slack_user_mentions.split()
-        fnc = slack_sender(slack_webhook, slack_channel, slack_user_mentions)(fnc)
-
-    if teams_webhook := constants.TEAMS_WEBHOOK_URL:
-        if teams_user_mentions := constants.TEAMS_USER_MENTIONS:
-            teams_user_mentions = teams_user_mentions.split()
-        fnc = teams_sender(teams_webhook, teams_user_mentions)(fnc)
+    cassette_ = Cassette(constants.CASSETTE_FILEPATH, mode=RECORD) if constants.CASSETTE_RECORD else None
+    profiler_ = None
+    if constants.PROFILE:
+        profiler_ = Profiler(profile_dir(constants.PROFILE_FOLDER), interval=constants.PROFILE_INTERVAL)
+    manager = YoutubeAutoManager(
+        oauth=oauth_,
+        db=db_,
+        config=config_,
+        cassette=cassette_,
+        notifier=notifier_,
+        profiler=profiler_,
+    )
 
-    fnc()
+    fnc = manager.serve if constants.WEBSUB else manager.start
+    try:
+        fnc()
+    except Exception as e:
+        notifier_.push(ERROR, f"Crashed: {type(e).__name__}: {e}")
+        raise
+    finally:
+        notifier_.close()
     pass
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import argparse
+
+from global_logger import Log
+
+from youtube_automanager import constants
+from youtube_automanager.backfill import describe, quota_day
+from youtube_automanager.config import YoutubeAutoManagerConfig
+from youtube_automanager.db import DatabaseController
+
+LOG = Log.get_logger()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the progress of the backfills. They run with automanage")
+    parser.parse_args()
+
+    config = YoutubeAutoManagerConfig(config_filepath=constants.CONFIG_FILEPATH)
+    configured = {_.key for _ in config.backfills} if config.ok else set()
+    db = DatabaseController(db_filepath=constants.DB_FILEPATH, username=constants.USERNAME)
+    jobs = db.backfill_jobs()
+    for key in sorted(configured - jobs.keys()):
+        LOG.green(f"{key}: not started")
+    for job_id, job in sorted(jobs.items()):
+        note = "" if job_id in configured else " (no longer configured)"
+        LOG.green(f"{job_id}: {describe(db, job)}{note}")
+
+    limit = int(constants.DAILY_QUOTA * constants.BACKFILL_QUOTA_SHARE)
+    used = (db.config.backfill_quota_used or 0) if db.config.backfill_quota_day == quota_day() else 0
+    LOG.green(f"Backfill quota used today: {used}/{limit} units")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pendulum
+from global_logger import Log
+
+from youtube_automanager import constants
+from youtube_automanager.db import DatabaseController, PlaylistLedger
+
+LOG = Log.get_logger()
+
+
+def ledger_rows(username, count, playlists=50):
+    now = datetime.now(tz=pendulum.local_timezone())
+    return [
+        dict(
+            username=username,
+            playlist_id=f"PL{i % playlists:032d}",
+            video_id=f"{i:011d}",
+            channel_id=f"UC{i % 900:022d}",
+            published_at=now - timedelta(minutes=i),
+            added_at=now,
+        )
+        for i in range(count)
+    ]
+
+
+def bench_unit_of_work(db: DatabaseController, rows):
+    started = time.perf_counter()
+    with db.unit_of_work():
+        db.upsert(PlaylistLedger, rows)
+    return time.perf_counter() - started
+
+
+def bench_per_row_commit(db: DatabaseController, rows):
+    started = time.perf_counter()
+    for row in rows:
+        db.db.add(PlaylistLedger(**row))
+        db.db.commit()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ledger writes: one unit of work vs commit per row")
+    parser.add_argument("--rows", default=100_000, type=int)
+    parser.add_argument("--per-row-sample", default=1_000, type=int, help="rows written with a commit each")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = DatabaseController(db_filepath=Path(tmp_dir) / constants.DB_FILENAME, username=constants.USERNAME)
+        rows = ledger_rows(db.username, args.rows)
+        elapsed = bench_unit_of_work(db, rows)
+        LOG.green(f"unit of work: {args.rows} rows in {elapsed:.3f}s ({args.rows / elapsed:,.0f} rows/s)")
+
+        # re-running the same rows exercises the ON CONFLICT update path
+        elapsed = bench_unit_of_work(db, rows)
+        LOG.green(f"unit of work upsert: {args.rows} rows in {elapsed:.3f}s ({args.rows / elapsed:,.0f} rows/s)")
+
+        sample = ledger_rows(f"{db.username}_per_row", args.per_row_sample)
+        elapsed = bench_per_row_commit(db, sample)
+        LOG.green(
+            f"commit per row: {len(sample)} rows in {elapsed:.3f}s ({len(sample) / elapsed:,.0f} rows/s), "
+            f"{args.rows} rows projected to {elapsed * args.rows / len(sample):.1f}s",
+        )
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import argparse
+import statistics
+import sys
+
+from global_logger import Log
+
+from youtube_automanager import constants
+from youtube_automanager.cassette import Cassette
+from youtube_automanager.config import YoutubeAutoManagerConfig
+from youtube_automanager.db import DatabaseController
+from youtube_automanager.planner import CapacityPlan
+
+LOG = Log.get_logger()
+
+
+def cassette_latencies(path) -> tuple[float, float]:
+    """Mean latency of the recorded reads and of the recorded inserts."""
+    cassette = Cassette(path)
+    reads = [_["elapsed"] for _ in cassette.interactions if _["method"] == "GET"]
+    inserts = [_["elapsed"] for _ in cassette.interactions if _["method"] == "POST" and "playlistItems" in _["url"]]
+    return statistics.fmean(reads or [0.0]), statistics.fmean(inserts or [0.0])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Estimate the API requests, quota and run time of the config from the database, without the API",
+    )
+    parser.add_argument("--config", default=constants.CONFIG_FILEPATH, help="config to plan, e.g. a new revision")
+    parser.add_argument("--interval", default=constants.WEBSUB_RECONCILE_INTERVAL, type=float, help="seconds")
+    parser.add_argument("--concurrency", default=constants.INSERT_WORKERS, type=int)
+    parser.add_argument("--accounts", default=1, type=int, help="accounts of this size sharing the quota")
+    parser.add_argument("--read-latency", default=0.3, type=float, help="seconds per read request")
+    parser.add_argument("--insert-latency", default=0.8, type=float, help="seconds per insert")
+    parser.add_argument("--cassette", help="take the latencies from a recorded cassette instead")
+    parser.add_argument("--title-match-rate", default=0.25, type=float, help="share of videos matching title patterns")
+    parser.add_argument("--default-upload-rate", default=0.5, type=float, help="uploads/day of unobserved channels")
+    args = parser.parse_args()
+
+    config = YoutubeAutoManagerConfig(config_filepath=args.config)
+    if not config.ok:
+        sys.exit(1)
+
+    read_latency, insert_latency = args.read_latency, args.insert_latency
+    if args.cassette:
+        read_latency, insert_latency = cassette_latencies(args.cassette)
+        LOG.green(f"Latencies from {args.cassette}: {read_latency:.3f}s per read, {insert_latency:.3f}s per insert")
+
+    db = DatabaseController(db_filepath=constants.DB_FILEPATH, username=constants.USERNAME)
+    if not db.watermarks():
+        LOG.error(f"No subscriptions cached in {db.db_filepath} yet, run automanage once first")
+        sys.exit(1)
+
+    plan = CapacityPlan(
+        config,
+        db,
+        interval=args.interval,
+        title_match_rate=args.title_match_rate,
+        default_upload_rate=args.default_upload_rate,
+        accounts=args.accounts,
+    )
+    fits = plan.report(
+        daily_quota=constants.DAILY_QUOTA,
+        backfill_share=constants.BACKFILL_QUOTA_SHARE,
+        concurrency=args.concurrency,
+        read_latency=read_latency,
+        insert_latency=insert_latency,
+    )
+    db.close()
+    sys.exit(0 if fits else 2)
+
+
+if __name__ == "__main__":
+    main()
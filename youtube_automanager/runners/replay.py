@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from global_logger import Log
+
+from youtube_automanager import constants
+from youtube_automanager.cassette import Cassette, REPLAY
+from youtube_automanager.config import YoutubeAutoManagerConfig
+from youtube_automanager.db import DatabaseController
+from youtube_automanager.runners.automanage import YoutubeAutoManager
+
+LOG = Log.get_logger()
+
+
+def replay(cassette: Cassette, config: YoutubeAutoManagerConfig):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = DatabaseController(db_filepath=Path(tmp_dir) / constants.DB_FILENAME, username=constants.USERNAME)
+        if (start_date := cassette.start_date) is not None:
+            db.config.last_update = start_date
+            db.save_config()
+            db.commit()
+
+        manager = YoutubeAutoManager(oauth=None, db=db, config=config, cassette=cassette)
+        started = time.perf_counter()
+        manager.parse()
+        elapsed = time.perf_counter() - started
+        db.close()
+
+    LOG.green(
+        f"Replayed {len(cassette.interactions)} recorded interactions in {elapsed:.3f}s "
+        f"(recorded network latency {cassette.recorded_latency:.3f}s, {cassette.misses} misses)",
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded cassette through the parse code path offline")
+    parser.add_argument("cassette", nargs="?", default=constants.CASSETTE_FILEPATH, type=Path)
+    parser.add_argument("--config", default=constants.CONFIG_FILEPATH, type=Path)
+    parser.add_argument("--latency", action="store_true", help="sleep for the originally recorded latency")
+    parser.add_argument("--latency-factor", default=1.0, type=float)
+    args = parser.parse_args()
+
+    config = YoutubeAutoManagerConfig(config_filepath=args.config)
+    if not config.ok:
+        sys.exit(1)
+
+    cassette = Cassette(
+        args.cassette,
+        mode=REPLAY,
+        simulate_latency=args.latency,
+        latency_factor=args.latency_factor,
+    )
+    replay(cassette, config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import hmac
+import secrets
+from datetime import datetime
+from urllib.parse import parse_qsl
+from xml.sax.saxutils import escape
+
+import pendulum
+import requests
+import uvicorn
+from fastapi import BackgroundTasks, FastAPI, Request
+from fastapi.responses import Response
+from global_logger import Log
+
+from youtube_automanager.websub import topic_url
+
+LOG = Log.get_logger()
+TIMEOUT = 10
+FEED_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+  <link rel="hub" href="{hub}"/>
+  <link rel="self" href="{topic}"/>
+  <title>YouTube video feed</title>
+  <updated>{published}</updated>
+  <entry>
+    <id>yt:video:{video_id}</id>
+    <yt:videoId>{video_id}</yt:videoId>
+    <yt:channelId>{channel_id}</yt:channelId>
+    <title>{title}</title>
+    <link rel="alternate" href="https://www.youtube.com/watch?v={video_id}"/>
+    <author>
+      <name>{channel_name}</name>
+      <uri>https://www.youtube.com/channel/{channel_id}</uri>
+    </author>
+    <published>{published}</published>
+    <updated>{published}</updated>
+  </entry>
+</feed>
+"""
+
+
+class StandInHub:
+    """
+    Minimal local WebSub hub for exercising push ingestion without the public hub.
+
+    Subscriptions are verified against the callback like the real hub does,
+    and ``POST /publish`` announces a fake upload to every subscriber of the channel.
+    """
+
+    def __init__(self, hub_url):
+        self.hub_url = hub_url
+        self.subscriptions: dict[str, dict[str, str]] = {}  # topic -> callback -> secret
+
+    def verify(self, params: dict):
+        mode = params["hub.mode"]
+        topic = params["hub.topic"]
+        callback = params["hub.callback"]
+        challenge = secrets.token_urlsafe(16)
+        query = {
+            "hub.mode": mode,
+            "hub.topic": topic,
+            "hub.challenge": challenge,
+            "hub.lease_seconds": params.get("hub.lease_seconds", "432000"),
+        }
+        try:
+            response = requests.get(callback, params=query, timeout=TIMEOUT)
+        except requests.RequestException as e:
+            LOG.exception(f"Hub: failed to verify {mode} of {callback} to {topic}", exc_info=e)
+            return
+
+        if response.status_code // 100 != 2 or response.text != challenge:  # noqa: PLR2004
+            LOG.yellow(f"Hub: {callback} did not confirm {mode} to {topic}")
+            return
+
+        subscribers = self.subscriptions.setdefault(topic, {})
+        if mode == "subscribe":
+            subscribers[callback] = params.get("hub.secret", "")
+        else:
+            subscribers.pop(callback, None)
+        LOG.green(f"Hub: {mode} of {callback} to {topic} verified")
+
+    def publish(self, channel_id, video_id, title, channel_name=""):
+        topic = topic_url(channel_id)
+        body = FEED_TEMPLATE.format(
+            hub=escape(self.hub_url),
+            topic=escape(topic),
+            video_id=escape(video_id),
+            channel_id=escape(channel_id),
+            channel_name=escape(channel_name),
+            title=escape(title),
+            published=pendulum.instance(datetime.now(tz=pendulum.UTC)).to_iso8601_string(),
+        ).encode("utf-8")
+        delivered = 0
+        for callback, secret in self.subscriptions.get(topic, {}).items():
+            headers = {"Content-Type": "application/atom+xml", "Link": f'<{topic}>; rel="self"'}
+            if secret:
+                digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha1).hexdigest()
+                headers["X-Hub-Signature"] = f"sha1={digest}"
+            try:
+                requests.post(callback, data=body, headers=headers, timeout=TIMEOUT)
+            except requests.RequestException as e:
+                LOG.exception(f"Hub: failed to deliver {video_id} to {callback}", exc_info=e)
+                continue
+
+            delivered += 1
+        return delivered
+
+    def app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/subscribe")
+        async def subscribe(request: Request, background_tasks: BackgroundTasks):
+            params = dict(parse_qsl((await request.body()).decode("utf-8"), keep_blank_values=True))
+            if params.get("hub.mode") not in {"subscribe", "unsubscribe"} or not params.get("hub.topic"):
+                return Response(status_code=400)
+
+            background_tasks.add_task(self.verify, params)
+            return Response(status_code=202)
+
+        @app.post("/publish")
+        def publish(channel_id: str, video_id: str, title: str, channel_name: str = ""):
+            return {"delivered": self.publish(channel_id, video_id, title, channel_name)}
+
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in WebSub hub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8082, type=int)
+    args = parser.parse_args()
+
+    hub = StandInHub(hub_url=f"http://{args.host}:{args.port}/subscribe")
+    LOG.green(f"Stand-in hub @ {hub.hub_url}, set WEBSUB_HUB_URL to it")
+    uvicorn.run(hub.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import hashlib
+import hmac
+import queue
+import secrets
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import xml.etree.ElementTree as ET
+
+import requests
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, Response
+from global_logger import Log
+
+from youtube_automanager.db import DatabaseController, local_now, WebSubSubscription
+from youtube_automanager.oauth import Server
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+LOG = Log.get_logger()
+
+TOPIC_URL = "https://www.youtube.com/xml/feeds/videos.xml?channel_id={channel_id}"
+FEED_NAMESPACES = {
+    "atom": "http://www.w3.org/2005/Atom",
+    "yt": "http://www.youtube.com/xml/schemas/2015",
+}
+# renew a lease this long before it runs out, re-request a subscription the hub never verified after this long
+RENEW_BEFORE = timedelta(days=1)
+PENDING_TIMEOUT = timedelta(hours=1)
+HUB_TIMEOUT = 10
+# hub.mode values we confirm, by the state of the subscription the verification is for
+VERIFIABLE = {
+    ("subscribe", WebSubSubscription.PENDING),
+    ("subscribe", WebSubSubscription.SUBSCRIBED),
+    ("unsubscribe", WebSubSubscription.UNSUBSCRIBING),
+    ("denied", WebSubSubscription.PENDING),
+    ("denied", WebSubSubscription.SUBSCRIBED),
+}
+
+
+def topic_url(channel_id):
+    return TOPIC_URL.format(channel_id=channel_id)
+
+
+class FeedEntry:
+    """Video announced by a hub notification."""
+
+    def __init__(self, video_id, channel_id, channel_name, title, published_at):
+        self.video_id = video_id
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.title = title
+        self.published_at = published_at
+
+    def __repr__(self):
+        return f"FeedEntry({self.video_id!r}, {self.channel_id!r}, {self.title!r}, {self.published_at!r})"
+
+
+def parse_feed(body: bytes) -> list[FeedEntry]:
+    """Parse the Atom document of a YouTube hub notification. Deleted and undated entries are skipped."""
+    # expat does not resolve external entities and guards against entity expansion
+    root = ET.fromstring(body)  # noqa: S314
+    output = []
+    for entry in root.iterfind("atom:entry", FEED_NAMESPACES):
+        video_id = entry.findtext("yt:videoId", namespaces=FEED_NAMESPACES)
+        channel_id = entry.findtext("yt:channelId", namespaces=FEED_NAMESPACES)
+        published_at = entry.findtext("atom:published", namespaces=FEED_NAMESPACES)
+        if not video_id or not channel_id or not published_at:
+            continue
+
+        output.append(
+            FeedEntry(
+                video_id=video_id,
+                channel_id=channel_id,
+                channel_name=entry.findtext("atom:author/atom:name", default="", namespaces=FEED_NAMESPACES),
+                title=entry.findtext("atom:title", default="", namespaces=FEED_NAMESPACES),
+                published_at=published_at,
+            ),
+        )
+    return output
+
+
+def signature_ok(secret: str, body: bytes, signature: str | None) -> bool:
+    if not signature or "=" not in signature:
+        return False
+
+    method, digest = signature.split("=", 1)
+    if method not in {"sha1", "sha256", "sha384", "sha512"}:
+        return False
+
+    expected = hmac.new(secret.encode("utf-8"), body, getattr(hashlib, method)).hexdigest()
+    return hmac.compare_digest(expected, digest)
+
+
+class WebSubSubscriber:
+    """Keeps a hub subscription with a live lease for every followed channel."""
+
+    def __init__(
+        self,
+        db: DatabaseController,
+        hub_url: str,
+        callback_url: str,
+        lease_seconds: int,
+        session: requests.Session | None = None,
+    ):
+        self.db = db
+        self.hub_url = hub_url
+        self.callback_url = callback_url
+        self.lease_seconds = lease_seconds
+        self.renew_before = min(RENEW_BEFORE, timedelta(seconds=lease_seconds) / 2)
+        self.session = session or requests.Session()
+
+    def _request(self, mode, subscription: WebSubSubscription):
+        data = {
+            "hub.callback": self.callback_url,
+            "hub.topic": subscription.topic,
+            "hub.mode": mode,
+            "hub.verify": "async",
+            "hub.secret": subscription.secret,
+            "hub.lease_seconds": self.lease_seconds,
+        }
+        try:
+            response = self.session.post(self.hub_url, data=data, timeout=HUB_TIMEOUT)
+        except requests.RequestException as e:
+            LOG.exception(f"WebSub {mode} request for {subscription.channel_id} failed", exc_info=e)
+            return False
+
+        if not response.ok:
+            LOG.error(
+                f"WebSub hub refused {mode} for {subscription.channel_id}: {response.status_code} {response.text}",
+            )
+            return False
+
+        return True
+
+    def needs_subscribe(self, subscription: WebSubSubscription | None, now: datetime) -> bool:
+        if subscription is None or subscription.state in {
+            WebSubSubscription.UNSUBSCRIBING,
+            WebSubSubscription.UNSUBSCRIBED,
+        }:
+            return True
+
+        if subscription.state == WebSubSubscription.PENDING:
+            return subscription.requested_at is None or now - subscription.requested_at > PENDING_TIMEOUT
+
+        return subscription.lease_expires_at is None or subscription.lease_expires_at - now < self.renew_before
+
+    @staticmethod
+    def needs_unsubscribe(subscription: WebSubSubscription, now: datetime) -> bool:
+        if subscription.state == WebSubSubscription.UNSUBSCRIBED:
+            return False
+
+        if subscription.state == WebSubSubscription.UNSUBSCRIBING:
+            return subscription.requested_at is None or now - subscription.requested_at > PENDING_TIMEOUT
+
+        return True
+
+    def sync(self, channel_ids: Iterable[str]):
+        """Subscribe new channels, renew expiring leases and unsubscribe channels that are no longer followed."""
+        channel_ids = set(channel_ids)
+        now = local_now()
+        subscriptions = self.db.websub_subscriptions()
+        to_subscribe = []
+        to_unsubscribe = []
+        renewing = 0
+        # requests are committed before the hub is asked, the hub may call back verifying them right away
+        with self.db.unit_of_work():
+            for channel_id in sorted(channel_ids):
+                subscription = subscriptions.get(channel_id)
+                if not self.needs_subscribe(subscription, now):
+                    continue
+
+                if subscription is None:
+                    subscription = WebSubSubscription(
+                        username=self.db.username,
+                        channel_id=channel_id,
+                        topic=topic_url(channel_id),
+                        secret=secrets.token_hex(20),
+                    )
+                    self.db.add(subscription)
+                renewing += subscription.state == WebSubSubscription.SUBSCRIBED
+                subscription.state = WebSubSubscription.PENDING
+                subscription.requested_at = now
+                to_subscribe.append(subscription)
+
+            for channel_id, subscription in subscriptions.items():
+                if channel_id in channel_ids or not self.needs_unsubscribe(subscription, now):
+                    continue
+
+                subscription.state = WebSubSubscription.UNSUBSCRIBING
+                subscription.requested_at = now
+                to_unsubscribe.append(subscription)
+
+        subscribed = sum(self._request("subscribe", _) for _ in to_subscribe)
+        unsubscribed = sum(self._request("unsubscribe", _) for _ in to_unsubscribe)
+        LOG.green(
+            f"WebSub: {subscribed}/{len(to_subscribe)} subscriptions requested ({renewing} renewals), "
+            f"{unsubscribed}/{len(to_unsubscribe)} unsubscriptions requested",
+        )
+
+
+class WebSubServer:
+    """
+    FastAPI endpoint the hub verifies subscriptions against and posts notifications to.
+
+    Verified notifications are put on ``queue`` as ``FeedEntry`` objects for the caller to process.
+    Runs in its own thread with its own database session.
+    """
+
+    def __init__(self, db_filepath: str | Path, username: str, callback_url: str, host: str, port: int):
+        self.db = DatabaseController(db_filepath=db_filepath, username=username)
+        self.path = urlsplit(callback_url).path or "/"
+        self.host = host
+        self.port = port
+        self.queue: queue.Queue[FeedEntry] = queue.Queue()
+        self._server: Server | None = None
+
+    def verify(self, params: dict) -> str | None:
+        """
+        Return the challenge to echo if the hub verification matches a request we made.
+
+        Subscribing is confirmed for pending and live subscriptions only, unsubscribing only for subscriptions
+        we asked to drop, so nobody else can cancel our subscriptions through the hub.
+        """
+        mode = params.get("hub.mode")
+        topic = params.get("hub.topic")
+        challenge = params.get("hub.challenge")
+        with self.db.unit_of_work():
+            subscription = self.db.websub_subscription_by_topic(topic) if topic else None
+            if subscription is None or challenge is None:
+                LOG.yellow(f"WebSub: refusing {mode} verification for unknown topic {topic}")
+                return None
+
+            if (mode, subscription.state) not in VERIFIABLE:
+                LOG.yellow(f"WebSub: refusing {mode} verification for {subscription.state} {subscription.channel_id}")
+                return None
+
+            now = local_now()
+            if mode == "subscribe":
+                lease_seconds = int(params.get("hub.lease_seconds") or 0)
+                subscription.state = WebSubSubscription.SUBSCRIBED
+                subscription.verified_at = now
+                subscription.lease_expires_at = now + timedelta(seconds=lease_seconds) if lease_seconds else None
+            elif mode == "unsubscribe":
+                subscription.state = WebSubSubscription.UNSUBSCRIBED
+                subscription.lease_expires_at = None
+            elif mode == "denied":
+                LOG.error(f"WebSub: hub denied subscription to {topic}: {params.get('hub.reason')}")
+                subscription.state = WebSubSubscription.UNSUBSCRIBED
+
+        LOG.debug(f"WebSub: verified {mode} for {subscription.channel_id}")
+        return challenge
+
+    def notify(self, body: bytes, signature: str | None) -> int:
+        """Queue the entries of an authentic notification and return how many were queued."""
+        try:
+            entries = parse_feed(body)
+        except ET.ParseError as e:
+            LOG.exception("WebSub: failed to parse notification", exc_info=e)
+            return 0
+
+        queued = 0
+        for entry in entries:
+            with self.db.unit_of_work():
+                subscription = self.db.websub_subscription(entry.channel_id)
+            if subscription is None or not signature_ok(subscription.secret, body, signature):
+                LOG.yellow(f"WebSub: dropping notification with a bad signature for {entry.channel_id}")
+                continue
+
+            LOG.green(f"WebSub: {entry.channel_name} published {entry.video_id} '{entry.title}'")
+            self.queue.put(entry)
+            queued += 1
+        return queued
+
+    def app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/health")
+        def health():
+            return {"status": "ok"}
+
+        # handlers are coroutines so that the database session is only ever used from the event loop thread
+        @app.get(self.path)
+        async def verification(request: Request):
+            challenge = self.verify(dict(request.query_params))
+            if challenge is None:
+                return Response(status_code=404)
+
+            return PlainTextResponse(challenge)
+
+        @app.post(self.path)
+        async def notification(request: Request):
+            body = await request.body()
+            self.notify(body, request.headers.get("x-hub-signature"))
+            # the hub only needs an acknowledgement, even for notifications we drop
+            return Response(status_code=204)
+
+        return app
+
+    def start(self):
+        LOG.debug(f"Starting WebSub webserver @ {self.host}:{self.port}{self.path}")
+        config = uvicorn.Config(
+            self.app(),
+            host=self.host,
+            port=int(self.port),
+            log_level="info" if not LOG.verbose else "debug",
+        )
+        self._server = Server(config=config)
+        self._server.run_in_thread()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.thread_exit()
+            self._server = None
@@ -1,39 +1,225 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-from functools import cache
+import functools
+import inspect
+import threading
+from collections import Counter
 
 from global_logger import Log
 
 # noinspection PyPackageRequirements
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from oauth2client.client import AccessTokenCredentials
 
 from youtube_automanager import constants
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from pyyoutube import Api, Playlist
+    from collections.abc import Callable, Hashable
+
+    from pyyoutube import Api, Playlist, PlaylistItemListResponse
+
+    from youtube_automanager.cassette import Cassette
 
 LOG = Log.get_logger()
+PAGE_SIZE = 50
+# 403 reasons that go away on their own, unlike a forbidden playlist
+TRANSIENT_REASONS = {"quotaExceeded", "rateLimitExceeded", "userRateLimitExceeded"}
+
+
+def uploads_playlist_id(channel_id: str) -> str:
+    # every channel's uploads are the playlist with the channel id's UC prefix replaced by UU
+    return f"UU{channel_id[2:]}" if channel_id.startswith("UC") else channel_id
+
+
+def transient_error(error: Exception) -> bool:
+    """Whether a failed call may succeed when retried later: quota, rate limits, server and network errors."""
+    if not isinstance(error, HttpError):
+        return True
+
+    if error.status_code >= 500 or error.status_code == 429:  # noqa: PLR2004
+        return True
+
+    details = error.error_details if isinstance(error.error_details, list) else []
+    return any(isinstance(_, dict) and _.get("reason") in TRANSIENT_REASONS for _ in details)
+
+
+def _normalize(value) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_normalize(_) for _ in value))
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(_) for _ in value)
+
+    return value
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time and remembers its result.
+
+    A caller asking for a key that is in flight waits for that call and shares its result or exception,
+    later callers get the remembered result. Failed calls are not remembered.
+    """
+
+    def __init__(self):
+        self.stats: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._results: dict = {}
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def do(self, key: Hashable, fnc: Callable[[], object]):
+        with self._lock:
+            self.stats["calls"] += 1
+            if key in self._results:
+                self.stats["cached"] += 1
+                return self._results[key]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["executed"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.result
+
+        try:
+            flight.result = fnc()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._results[key] = flight.result
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def clear(self):
+        """Forget the remembered results. Calls in flight still share their result with their waiters."""
+        with self._lock:
+            self._results.clear()
+
+
+def single_flight(fnc):
+    """
+    Cache a method like ``functools.cache`` does, and make concurrent identical calls share one request.
+
+    Calls are keyed on their arguments bound to the signature with the defaults applied, lists and dicts
+    included, so ``f(x)`` and ``f(x, limit=50)`` are the same call when 50 is the default.
+    """
+    signature = inspect.signature(fnc)
+
+    @functools.wraps(fnc)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        del arguments[next(iter(signature.parameters))]
+        for name, parameter in signature.parameters.items():
+            if parameter.kind is inspect.Parameter.VAR_KEYWORD:
+                arguments.update(arguments.pop(name))
+        return self.flight(fnc.__name__).do(_normalize(arguments), lambda: fnc(self, *args, **kwargs))
+
+    return wrapper
 
 
 class YoutubeAPI:
-    def __init__(self, api: Api, access_token: str):
+    def __init__(
+        self,
+        api: Api,
+        access_token: str,
+        cassette: Cassette | None = None,
+        token_provider: Callable[[], str] | None = None,
+    ):
         self.api = api
         self.access_token = access_token
+        self.cassette = cassette
+        self.token_provider = token_provider
+        self._token_lock = threading.Lock()
+        self._local = threading.local()
+        self._flights: dict[str, SingleFlight] = {}
+        self._flights_lock = threading.Lock()
+        if cassette is not None:
+            self.api.session.mount("https://", cassette.requests_adapter())
+
+    def flight(self, name) -> SingleFlight:
+        with self._flights_lock:
+            if (output := self._flights.get(name)) is None:
+                output = self._flights[name] = SingleFlight()
+            return output
+
+    def reset(self):
+        """Forget every remembered call result, so the next calls see the current state of the account."""
+        with self._flights_lock:
+            flights = list(self._flights.values())
+        for flight in flights:
+            flight.clear()
+
+    def log_stats(self):
+        for name, flight in sorted(self._flights.items()):
+            stats = flight.stats
+            LOG.debug(
+                f"{name}: {stats['calls']} calls, {stats['executed']} requested, "
+                f"{stats['cached']} cached, {stats['coalesced']} coalesced",
+            )
+        if coalesced := sum(_.stats["coalesced"] for _ in self._flights.values()):
+            LOG.green(f"{coalesced} API calls coalesced with identical calls in flight")
+
+    def set_access_token(self, access_token):
+        with self._token_lock:
+            self.access_token = access_token
+            self.api._access_token = access_token  # noqa: SLF001
+
+    def _sync_token(self):
+        if self.token_provider is not None and (access_token := self.token_provider()) != self.access_token:
+            self.set_access_token(access_token)
+
+    def _build_google_api(self, access_token):
+        creds = AccessTokenCredentials(access_token, "")
+        if self.cassette is not None:
+            http = creds.authorize(self.cassette.http())
+            return build(constants.YOUTUBE_API_SERVICE_NAME, constants.YOUTUBE_API_VERSION, http=http)
+
+        return build(constants.YOUTUBE_API_SERVICE_NAME, constants.YOUTUBE_API_VERSION, credentials=creds)
 
     @property
     def google_api(self):
-        creds = AccessTokenCredentials(self.access_token, "")
-        return build(constants.YOUTUBE_API_SERVICE_NAME, constants.YOUTUBE_API_VERSION, credentials=creds)
+        # httplib2 is not thread-safe: one client per thread, rebuilt when the access token changes
+        access_token = self.access_token
+        local = self._local
+        if getattr(local, "access_token", None) != access_token:
+            local.google_api = self._build_google_api(access_token)
+            local.access_token = access_token
+        return local.google_api
 
-    @cache  # noqa: B019
+    @single_flight
     def video_in_playlist(self, playlist_id, video_id):
         playlist_videos = self.get_playlist_items(playlist_id=playlist_id)
-        output = [i for i in playlist_videos if i.id == video_id]
+        output = [i for i in playlist_videos if i.contentDetails.videoId == video_id]
         return len(output) > 0
 
     def add_video_to_playlist(self, video_id, playlist_id):
+        self._sync_token()
         add_video_request = (
             self.google_api.playlistItems()
             .insert(
@@ -53,8 +239,9 @@ class YoutubeAPI:
         )
         return add_video_request
 
-    @cache  # noqa: B019
+    @single_flight
     def get_playlist_items(self, playlist_id):
+        self._sync_token()
         kwargs = dict(playlist_id=playlist_id, limit=50, count=None)
         response = self.api.get_playlist_items(**kwargs)
         output = response.items
@@ -68,7 +255,7 @@ class YoutubeAPI:
             output.extend(output_)
         return output
 
-    @cache  # noqa: B019
+    @single_flight
     def get_subscriptions(  # noqa: PLR0913
         self,
         mine=True,
@@ -76,12 +263,13 @@ class YoutubeAPI:
         limit=50,
         order="unread",
         page_token=None,
-        parts=None,
+        parts=("snippet",),
         **kwargs,
     ):
         # https://developers.google.com/youtube/v3/docs/subscriptions/list
         LOG.green("Getting subscriptions")
-        parts = parts or ["snippet"]
+        self._sync_token()
+        parts = list(parts)
         subs = self.api.get_subscription_by_me(
             mine=mine,
             count=count,
@@ -110,13 +298,11 @@ class YoutubeAPI:
             output.extend(subs_)
         return output
 
-    @cache  # noqa: B019
-    def get_playlists(self, **kwargs) -> list[Playlist]:
-        kwargs.setdefault("mine", True)
-        kwargs.setdefault("count", None)
-        kwargs.setdefault("parts", ["snippet"])
+    @single_flight
+    def get_playlists(self, mine=True, count=None, parts=("snippet", "contentDetails"), **kwargs) -> list[Playlist]:
         LOG.green("Getting playlists")
-        response = self.api.get_playlists(**kwargs)
+        self._sync_token()
+        response = self.api.get_playlists(mine=mine, count=count, parts=list(parts), **kwargs)
         output = response.items
         return output
 
@@ -125,7 +311,25 @@ class YoutubeAPI:
         playlist = (i for i in playlists if i.id == playlist_id)
         return next(playlist, None)
 
-    @cache  # noqa: B019
-    def get_channel_activities(self, channel_id, **kwargs):
-        kwargs.setdefault("parts", ["id", "snippet", "contentDetails"])
-        return self.api.get_activities_by_channel(channel_id=channel_id, **kwargs)
+    @single_flight
+    def get_channel_activities(self, channel_id, parts=("id", "snippet", "contentDetails"), **kwargs):
+        """Every activity of the channel within ``after`` and ``before``, not just the first 20 pyyoutube returns."""
+        self._sync_token()
+        return self.api.get_activities_by_channel(
+            channel_id=channel_id,
+            parts=list(parts),
+            count=None,
+            limit=PAGE_SIZE,
+            **kwargs,
+        )
+
+    def get_uploads_page(self, channel_id, page_token=None) -> PlaylistItemListResponse:
+        """One page of the channel uploads, newest first."""
+        self._sync_token()
+        return self.api.get_playlist_items(
+            playlist_id=uploads_playlist_id(channel_id),
+            parts=["snippet", "contentDetails"],
+            count=PAGE_SIZE,
+            limit=PAGE_SIZE,
+            page_token=page_token,
+        )